@@ -0,0 +1,283 @@
+"""
+Набор тестов производительности кодера, декодера и метрик.
+Для каждого размера синтетического контейнера (в мегапикселях) и размера
+нагрузки измеряются этапы load, embed, save, extract и metrics: время,
+пропускная способность (МБ/с нагрузки) и пик памяти tracemalloc за время этапа.
+Отдельно измеряется время импорта модулей в новом процессе интерпретатора.
+Результаты выводятся в JSON и могут сравниваться с сохраненным базовым запуском.
+
+Примеры:
+    python benchmark.py --sizes 0.1 1 10 100 --payloads 64 10% full --output run.json
+    python benchmark.py --baseline run.json --threshold 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from image_cache import get_cache
+from image_io import save_image
+from lsb_decoder import LSBDecoder
+from lsb_encoder import LSBEncoder
+from metrics import ImageQualityMetrics
+
+
+DEFAULT_SIZES = (0.1, 1, 10, 100)
+DEFAULT_PAYLOADS = ('64', '1%', 'full')
+STAGES = ('load', 'embed', 'save', 'extract', 'metrics')
+
+# Модули, время импорта которых отслеживается, и бюджет для ядра (кодер и декодер)
+IMPORT_MODULES = ('lsb_encoder', 'lsb_decoder', 'lsb_batch', 'metrics')
+CORE_MODULES = ('lsb_encoder', 'lsb_decoder')
+IMPORT_BUDGET_SECONDS = 0.2
+# Тяжелые зависимости и средства профилирования, которые не должны
+# загружаться при импорте модулей
+HEAVY_MODULES = ('skimage', 'scipy', 'cv2', 'cProfile', 'pstats', 'tracemalloc')
+
+# Разница во времени меньше этой величины не считается ухудшением (шум таймера)
+MIN_REGRESSION_SECONDS = 0.002
+
+
+def synthetic_pixels(megapixels, seed=0):
+    # Плавный градиент с шумом (4:3): сжимается примерно как фотография
+    width = max(1, int(round((megapixels * 1e6 * 4 / 3) ** 0.5)))
+    height = max(1, int(round(megapixels * 1e6 / width)))
+    rng = np.random.default_rng(seed)
+
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    for channel, (a, b) in enumerate(((0.7, 0.3), (0.3, 0.7), (0.5, 0.5))):
+        noise = rng.integers(0, 8, size=(height, width), dtype=np.uint8)
+        pixels[:, :, channel] = (a * y + b * x).astype(np.uint8) // 2 + noise
+    return pixels
+
+
+def payload_size(spec, capacity):
+    # '64' — число байт, '10%' — доля вместимости, 'full' — вся вместимость
+    if spec == 'full':
+        return capacity
+    if spec.endswith('%'):
+        return int(capacity * float(spec[:-1]) / 100)
+    return min(int(spec), capacity)
+
+
+def measure(function, repeat=1, memory=True):
+    # Лучшее время из repeat запусков без трассировки памяти, затем отдельный
+    # запуск под tracemalloc для пика выделенной памяти. Кэш пикселей очищается
+    # перед каждым запуском: измеряется декодирование, а не попадание в кэш
+    best = None
+    for _ in range(repeat):
+        get_cache().clear()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = None
+    if memory:
+        get_cache().clear()
+        tracemalloc.start()
+        try:
+            result = function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, best, peak
+
+
+def measure_import(module, repeat=3):
+    # Лучшее время запуска нового интерпретатора с импортом модуля и список
+    # тяжелых зависимостей, загруженных этим импортом
+    directory = os.path.dirname(os.path.abspath(__file__))
+    code = (f"import sys, {module}; "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code], cwd=directory, check=True,
+                                capture_output=True, text=True).stdout
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        'megapixels': None,
+        'payload': None,
+        'module': module,
+        'stage': 'import',
+        'seconds': best,
+        'heavy_modules': [name for name in output.strip().split(',') if name]
+    }
+
+
+def run_case(megapixels, spec, directory, seed=0, repeat=1, memory=True):
+    # Все этапы для одного размера контейнера и одной нагрузки
+    original_path = os.path.join(directory, f"original_{megapixels}.png")
+    stego_path = os.path.join(directory, f"stego_{megapixels}_{spec.replace('%', 'pct')}.png")
+    if not os.path.exists(original_path):
+        save_image(synthetic_pixels(megapixels, seed), original_path)
+
+    encoder = LSBEncoder(original_path)
+    size = payload_size(spec, encoder.calculate_capacity())
+    payload = np.random.default_rng(seed + 1).integers(0, 256, size, dtype=np.uint8).tobytes()
+
+    state = {}
+    stages = {
+        'load': lambda: LSBEncoder(original_path),
+        'embed': lambda: encoder.embed_to_array(payload),
+        'save': lambda: save_image(state['stego'], stego_path),
+        'extract': lambda: LSBDecoder(stego_path).extract_bytes(),
+        'metrics': lambda: ImageQualityMetrics.get_full_report(original_path, stego_path),
+    }
+
+    results = []
+    for stage in STAGES:
+        result, seconds, peak = measure(stages[stage], repeat, memory)
+        if stage == 'embed':
+            state['stego'] = result
+        elif stage == 'extract' and result != payload:
+            raise RuntimeError(f"Извлеченная нагрузка не совпадает ({megapixels} Мп, {spec})")
+
+        results.append({
+            'megapixels': megapixels,
+            'width': encoder.width,
+            'height': encoder.height,
+            'payload': spec,
+            'payload_bytes': size,
+            'stage': stage,
+            'seconds': seconds,
+            'throughput_mbps': size / 1e6 / seconds if seconds else None,
+            'peak_tracemalloc_bytes': peak
+        })
+    return results
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, payloads=DEFAULT_PAYLOADS, seed=0, repeat=1, memory=True,
+                  import_modules=IMPORT_MODULES):
+
+    results = [measure_import(module, max(3, repeat)) for module in import_modules]
+    with tempfile.TemporaryDirectory() as directory:
+        for megapixels in sizes:
+            for spec in payloads:
+                results.extend(run_case(megapixels, spec, directory, seed, repeat, memory))
+            # Файлы текущего размера больше не нужны
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeat': repeat,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
+        },
+        'results': results
+    }
+
+
+def _result_key(result):
+
+    return result['megapixels'], result['payload'], result['stage'], result.get('module')
+
+
+def compare_results(current, baseline, threshold=0.2):
+    # Этапы, время которых выросло больше чем в (1 + threshold) раз относительно базового
+    baseline_seconds = {_result_key(result): result['seconds'] for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        previous = baseline_seconds.get(_result_key(result))
+        if previous is None:
+            continue
+        if result['seconds'] > previous * (1 + threshold) \
+                and result['seconds'] - previous > MIN_REGRESSION_SECONDS:
+            regressions.append({
+                'megapixels': result['megapixels'],
+                'payload': result['payload'],
+                'module': result.get('module'),
+                'stage': result['stage'],
+                'baseline_seconds': previous,
+                'seconds': result['seconds'],
+                'ratio': result['seconds'] / previous
+            })
+    return regressions
+
+
+def check_import_budget(report, budget=IMPORT_BUDGET_SECONDS):
+    # Модули ядра, импорт которых дольше бюджета или загружает тяжелые зависимости
+    violations = []
+    for result in report['results']:
+        if result['stage'] != 'import' or result['module'] not in CORE_MODULES:
+            continue
+        if result['seconds'] > budget or result['heavy_modules']:
+            violations.append({
+                'module': result['module'],
+                'stage': 'import',
+                'budget_seconds': budget,
+                'seconds': result['seconds'],
+                'heavy_modules': result['heavy_modules']
+            })
+    return violations
+
+
+def _describe(entry):
+    # Подпись замера для сообщений: размер и нагрузка или имя модуля
+    if entry.get('module'):
+        return f"{entry['stage']} ({entry['module']})"
+    return f"{entry['stage']} ({entry['megapixels']} Мп, {entry['payload']})"
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Тесты производительности LSB-стеганографии")
+    parser.add_argument('--sizes', type=float, nargs='+', default=list(DEFAULT_SIZES),
+                        help="размеры контейнеров в мегапикселях")
+    parser.add_argument('--payloads', nargs='+', default=list(DEFAULT_PAYLOADS),
+                        help="размеры нагрузки: число байт, процент вместимости или full")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1, help="число замеров времени каждого этапа")
+    parser.add_argument('--no-memory', action='store_true', help="не измерять память tracemalloc")
+    parser.add_argument('--output', help="файл для результатов JSON (по умолчанию stdout)")
+    parser.add_argument('--baseline', help="JSON базового запуска для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="допустимое относительное увеличение времени этапа")
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET_SECONDS,
+                        help="допустимое время импорта кодера и декодера, с")
+    parser.add_argument('--no-import', action='store_true', help="не измерять время импорта")
+    args = parser.parse_args(argv)
+
+    import_modules = () if args.no_import else IMPORT_MODULES
+    report = run_benchmark(args.sizes, args.payloads, args.seed, args.repeat, not args.no_memory,
+                           import_modules)
+    report['regressions'] = check_import_budget(report, args.import_budget)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['regressions'] += compare_results(report, json.load(f), args.threshold)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    for regression in report['regressions']:
+        limit = regression.get('baseline_seconds', regression.get('budget_seconds'))
+        sys.stderr.write(
+            f"Ухудшение: {_describe(regression)}: {limit:.4f} с -> {regression['seconds']:.4f} с\n"
+        )
+    return 1 if report['regressions'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
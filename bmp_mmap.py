@@ -0,0 +1,66 @@
+"""
+Прямой доступ к пикселям несжатых 24-битных BMP через numpy.memmap.
+Пиксели такого файла уже хранятся плоским массивом байтов, поэтому их
+можно читать и изменять на месте без декодирования и копирования всего
+изображения.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+
+# BITMAPFILEHEADER (14 байт) + начало BITMAPINFOHEADER
+BMP_HEADER_FORMAT = '<2sIHHIIiiHHI'
+BMP_HEADER_SIZE = struct.calcsize(BMP_HEADER_FORMAT)
+
+# Метод сжатия BI_RGB (без сжатия)
+BI_RGB = 0
+
+
+def probe_bmp(path):
+    #Возвращает раскладку пикселей BMP или None, если файл нельзя отобразить в память.
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(BMP_HEADER_SIZE)
+    except OSError:
+        return None
+
+    if len(header) < BMP_HEADER_SIZE:
+        return None
+
+    (signature, _, _, _, offset, dib_size, width, height,
+     planes, bits_per_pixel, compression) = struct.unpack(BMP_HEADER_FORMAT, header)
+
+    # Поддерживаются заголовки BITMAPINFOHEADER и новее (V4, V5)
+    if signature != b'BM' or dib_size < 40 or planes != 1:
+        return None
+    if bits_per_pixel != 24 or compression != BI_RGB or width <= 0 or height == 0:
+        return None
+
+    # Строки выровнены по 4 байта
+    stride = (width * 3 + 3) & ~3
+    if offset + stride * abs(height) > os.path.getsize(path):
+        return None
+
+    return {
+        'offset': offset,
+        'width': width,
+        'height': abs(height),
+        # Отрицательная высота означает порядок строк сверху вниз
+        'top_down': height < 0,
+        'stride': stride
+    }
+
+
+def map_bmp_pixels(path, layout, mode='r'):
+    # Возвращает представление формы (H, W, 3) в порядке строк сверху вниз и
+    # каналов RGB; это вид на отображенный файл, а не копия
+    raw = np.memmap(path, dtype=np.uint8, mode=mode, offset=layout['offset'],
+                    shape=(layout['height'], layout['stride']))
+    pixels = raw[:, :layout['width'] * 3].reshape(layout['height'], layout['width'], 3)
+    if not layout['top_down']:
+        pixels = pixels[::-1]
+    # BMP хранит каналы в порядке BGR
+    return pixels[:, :, ::-1]
@@ -7,9 +7,19 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from lsb_encoder import LSBEncoder
 from lsb_decoder import LSBDecoder
 from metrics import ImageQualityMetrics
+from image_io import save_cached
+from lsb_format import capacity_bytes
+from lsb_progress import CancelledError, CancelToken
+from instrumentation import collect
+
+
+# Период опроса очереди событий фоновых задач (мс)
+POLL_INTERVAL_MS = 50
 
 
 class SteganographyGUI:
@@ -25,6 +35,24 @@ class SteganographyGUI:
         # Переменные для хранения путей
         self.container_image_path = tk.StringVar()
         self.stego_image_path = tk.StringVar()
+        # Число младших бит каждого канала под нагрузку (1-4)
+        self.bits_per_channel = tk.IntVar(value=1)
+        # Сжатие сообщения перед встраиванием (алгоритм выбирается автоматически)
+        self.compress_payload = tk.BooleanVar(value=False)
+        # Помехоустойчивое кодирование (исправление одиночных ошибок)
+        self.error_correction = tk.BooleanVar(value=False)
+        self.container_info = None
+
+        # Тяжелая работа выполняется в фоновом потоке; события (ход выполнения,
+        # результаты, ошибки) передаются в главный поток через очередь,
+        # которую опрашивает root.after
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.events = queue.Queue()
+        self.cancel_token = None
+
+        # Строка состояния: время этапов последней операции
+        self.timing_status = ttk.Label(self.root, text="", anchor='w', foreground="gray")
+        self.timing_status.pack(side='bottom', fill='x', padx=10, pady=(0, 5))
 
         # Создание системы вкладок
         self.notebook = ttk.Notebook(self.root)
@@ -45,6 +73,8 @@ class SteganographyGUI:
         self.notebook.add(self.info_frame, text='О программе')
         self._create_info_tab()
 
+        self.root.after(POLL_INTERVAL_MS, self._poll_events)
+
     def _create_embed_tab(self):
         #"""Создание интерфейса вкладки встраивания."""
         # Кадр для выбора изображения
@@ -69,6 +99,16 @@ class SteganographyGUI:
         self.container_capacity_label = ttk.Label(info_frame, text="-")
         self.container_capacity_label.grid(row=1, column=1, sticky='w', padx=5, pady=5)
 
+        ttk.Label(info_frame, text="Бит на канал:").grid(row=2, column=0, sticky='w', padx=5, pady=5)
+        ttk.Spinbox(info_frame, from_=1, to=4, width=5, state='readonly',
+                    textvariable=self.bits_per_channel,
+                    command=self.update_capacity_label).grid(row=2, column=1, sticky='w', padx=5, pady=5)
+
+        ttk.Checkbutton(info_frame, text="Сжимать сообщение", variable=self.compress_payload) \
+            .grid(row=3, column=0, columnspan=2, sticky='w', padx=5, pady=5)
+        ttk.Checkbutton(info_frame, text="Помехоустойчивое кодирование", variable=self.error_correction) \
+            .grid(row=4, column=0, columnspan=2, sticky='w', padx=5, pady=5)
+
         # Поле ввода текста
         msg_frame = ttk.LabelFrame(self.embed_frame, text="Сообщение для встраивания")
         msg_frame.pack(fill='both', expand=True, padx=10, pady=10)
@@ -81,9 +121,18 @@ class SteganographyGUI:
         self.embed_text.config(yscrollcommand=scrollbar.set)
         scrollbar.config(command=self.embed_text.yview)
 
-        # Кнопка встраивания
-        ttk.Button(self.embed_frame, text="Встроить сообщение",
-                   command=self.embed_message).pack(pady=10)
+        # Кнопки встраивания и отмены
+        button_frame = ttk.Frame(self.embed_frame)
+        button_frame.pack(pady=10)
+        self.embed_button = ttk.Button(button_frame, text="Встроить сообщение",
+                                       command=self.embed_message)
+        self.embed_button.pack(side='left', padx=5)
+        self.embed_cancel_button = ttk.Button(button_frame, text="Отмена", state='disabled',
+                                              command=self.cancel_task)
+        self.embed_cancel_button.pack(side='left', padx=5)
+
+        self.embed_progress = ttk.Progressbar(self.embed_frame, mode='determinate', maximum=100)
+        self.embed_progress.pack(fill='x', padx=10)
 
         # Статус
         self.embed_status = ttk.Label(self.embed_frame, text="", foreground="blue")
@@ -101,9 +150,18 @@ class SteganographyGUI:
         self.stego_label = ttk.Label(select_frame, text="Не выбрано")
         self.stego_label.pack(side='left', padx=20)
 
-        # Кнопка извлечения
-        ttk.Button(self.extract_frame, text="Извлечь сообщение",
-                   command=self.extract_message).pack(pady=10)
+        # Кнопки извлечения и отмены
+        button_frame = ttk.Frame(self.extract_frame)
+        button_frame.pack(pady=10)
+        self.extract_button = ttk.Button(button_frame, text="Извлечь сообщение",
+                                         command=self.extract_message)
+        self.extract_button.pack(side='left', padx=5)
+        self.extract_cancel_button = ttk.Button(button_frame, text="Отмена", state='disabled',
+                                                command=self.cancel_task)
+        self.extract_cancel_button.pack(side='left', padx=5)
+
+        self.extract_progress = ttk.Progressbar(self.extract_frame, mode='determinate', maximum=100)
+        self.extract_progress.pack(fill='x', padx=10)
 
         # Поле вывода текста
         msg_frame = ttk.LabelFrame(self.extract_frame, text="Извлеченное сообщение")
@@ -148,7 +206,6 @@ class SteganographyGUI:
 • Python 3.10+
 • Pillow - обработка изображений
 • NumPy - работа с массивами
-• OpenCV - расчет метрик
 • scikit-image - индекс структурного сходства
 
 ИСПОЛЬЗОВАНИЕ
@@ -172,16 +229,24 @@ class SteganographyGUI:
         if file_path:
             try:
                 self.container_image_path.set(file_path)
-                encoder = LSBEncoder(file_path)
-                info = encoder.get_image_info()
+                # Размеры читаются из заголовка файла, пиксели не декодируются
+                info = LSBEncoder.probe(file_path)
+                self.container_info = info
 
                 self.container_label.config(text=os.path.basename(file_path))
                 self.container_size_label.config(text=f"{info['width']}×{info['height']}")
-                self.container_capacity_label.config(text=f"{info['capacity']} символов")
+                self.update_capacity_label()
                 self.embed_status.config(text="", foreground="blue")
             except Exception as e:
                 messagebox.showerror("Ошибка", f"Ошибка при загрузке изображения: {e}")
 
+    def update_capacity_label(self):
+        # Вместимость зависит от выбранного числа бит на канал
+        if self.container_info is None:
+            return
+        capacity = capacity_bytes(self.container_info['total_pixels'] * 3, self.bits_per_channel.get())
+        self.container_capacity_label.config(text=f"{capacity} байт")
+
     def select_stego_image(self):
         
         file_path = filedialog.askopenfilename(
@@ -193,6 +258,92 @@ class SteganographyGUI:
             self.stego_label.config(text=os.path.basename(file_path))
             self.extract_status.config(text="")
 
+    def _start_task(self, task, worker, *args):
+        # Запуск фоновой задачи; одновременно выполняется только одна
+        self.cancel_token = CancelToken()
+        for button in (self.embed_button, self.extract_button):
+            button.config(state='disabled')
+        cancel_button = self.embed_cancel_button if task == 'embed' else self.extract_cancel_button
+        cancel_button.config(state='normal')
+        progress_bar = self.embed_progress if task == 'embed' else self.extract_progress
+        progress_bar['value'] = 0
+
+        self.executor.submit(self._run_task, task, worker, self.cancel_token, *args)
+
+    def _run_task(self, task, worker, token, *args):
+        # Выполняется в фоновом потоке: виджеты не трогаем, только очередь событий.
+        # Время этапов собирается на время задачи и выводится в строку состояния
+        with collect() as stats:
+            try:
+                worker(token, *args)
+            except CancelledError:
+                self.events.put((task, 'cancelled', None))
+            except Exception as e:
+                self.events.put((task, 'error', e))
+            finally:
+                self.events.put((task, 'timings', stats.format_summary()))
+                self.events.put((task, 'finished', None))
+
+    def _progress_handler(self, task, token):
+        # Обработчик хода выполнения для кодера и декодера (вызывается в фоновом потоке)
+        def progress(done, total):
+            token.check()
+            self.events.put((task, 'progress', (done, total)))
+        return progress
+
+    def cancel_task(self):
+
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+
+    def _poll_events(self):
+        # Обработка событий фоновых задач в главном потоке Tk
+        try:
+            while True:
+                task, kind, value = self.events.get_nowait()
+                handler = getattr(self, f'_on_{task}_{kind}', None)
+                if handler is not None:
+                    handler(value)
+                elif kind == 'progress':
+                    self._on_progress(task, value)
+                elif kind == 'status':
+                    self._status_label(task).config(text=value, foreground="blue")
+                elif kind == 'cancelled':
+                    self._status_label(task).config(text="Операция отменена", foreground="red")
+                elif kind == 'error':
+                    self._on_error(task, value)
+                elif kind == 'timings':
+                    self.timing_status.config(text=value)
+                elif kind == 'finished':
+                    self._on_finished(task)
+        except queue.Empty:
+            pass
+        self.root.after(POLL_INTERVAL_MS, self._poll_events)
+
+    def _status_label(self, task):
+
+        return self.embed_status if task == 'embed' else self.extract_status
+
+    def _on_progress(self, task, value):
+
+        done, total = value
+        progress_bar = self.embed_progress if task == 'embed' else self.extract_progress
+        progress_bar['value'] = 100 * done / total if total else 100
+
+    def _on_error(self, task, error):
+
+        self._status_label(task).config(text=f"Ошибка: {error}", foreground="red")
+        title = "Ошибка при встраивании" if task == 'embed' else "Ошибка при извлечении"
+        messagebox.showerror("Ошибка", f"{title}: {error}")
+
+    def _on_finished(self, task):
+
+        self.cancel_token = None
+        for button in (self.embed_button, self.extract_button):
+            button.config(state='normal')
+        for button in (self.embed_cancel_button, self.extract_cancel_button):
+            button.config(state='disabled')
+
     def embed_message(self):
         
         if not self.container_image_path.get():
@@ -205,31 +356,52 @@ class SteganographyGUI:
             messagebox.showwarning("Внимание", "Введите сообщение")
             return
 
-        try:
+        output_path = filedialog.asksaveasfilename(
+            defaultextension=".png",
+            filetypes=[("PNG files", "*.png")]
+        )
+
+        if output_path:
             self.embed_status.config(text="Обработка...", foreground="blue")
-            self.root.update()
-
-            output_path = filedialog.asksaveasfilename(
-                defaultextension=".png",
-                filetypes=[("PNG files", "*.png")]
-            )
-
-            if output_path:
-                encoder = LSBEncoder(self.container_image_path.get())
-                encoder.embed_data(message, output_path)
-
-                # Расчет метрик качества
-                metrics = ImageQualityMetrics.get_full_report(
-                    self.container_image_path.get(), output_path
-                )
-
-                status_msg = f"Встраивание успешно! MSE: {metrics['MSE']}, PSNR: {metrics['PSNR']} dB, " \
-                            f"SSIM: {metrics['SSIM']}, Качество: {metrics['Quality']}"
-                self.embed_status.config(text=status_msg, foreground="green")
-                messagebox.showinfo("Успех", status_msg)
-        except Exception as e:
-            self.embed_status.config(text=f"Ошибка: {e}", foreground="red")
-            messagebox.showerror("Ошибка", f"Ошибка при встраивании: {e}")
+            compression = 'auto' if self.compress_payload.get() else None
+            options = {
+                'bits_per_channel': self.bits_per_channel.get(),
+                'compression': compression,
+                'error_correction': self.error_correction.get()
+            }
+            self._start_task('embed', self._embed_worker, self.container_image_path.get(),
+                             message, output_path, options)
+
+    def _embed_worker(self, token, container_path, message, output_path, options):
+
+        encoder = LSBEncoder(container_path, progress=self._progress_handler('embed', token),
+                             **options)
+        stego_pixels, embed_report = encoder.embed_to_array(message, return_report=True)
+
+        token.check()
+        self.events.put(('embed', 'status', "Сохранение..."))
+        save_cached(stego_pixels, output_path)
+
+        # MSE и PSNR известны точно из отчета о встраивании и показываются сразу,
+        # SSIM по уже загруженным массивам досчитывается и добавляется позже
+        self.events.put(('embed', 'saved', ImageQualityMetrics.report_from_embed(embed_report)))
+        ssim = ImageQualityMetrics.ssim_from_arrays(encoder.pixels, stego_pixels, tiled=True)
+        self.events.put(('embed', 'metrics', ImageQualityMetrics.report_from_embed(embed_report, ssim)))
+
+    def _on_embed_saved(self, metrics):
+
+        self.embed_progress['value'] = 100
+        self.embed_status.config(
+            text=f"Встраивание успешно! MSE: {metrics['MSE']}, PSNR: {metrics['PSNR']} dB, "
+                 f"SSIM: вычисляется..., Качество: {metrics['Quality']}",
+            foreground="green")
+
+    def _on_embed_metrics(self, metrics):
+
+        status_msg = f"Встраивание успешно! MSE: {metrics['MSE']}, PSNR: {metrics['PSNR']} dB, " \
+                     f"SSIM: {metrics['SSIM']}, Качество: {metrics['Quality']}"
+        self.embed_status.config(text=status_msg, foreground="green")
+        messagebox.showinfo("Успех", status_msg)
 
     def extract_message(self):
         
@@ -237,22 +409,23 @@ class SteganographyGUI:
             messagebox.showwarning("Внимание", "Выберите стего-изображение")
             return
 
-        try:
-            self.extract_status.config(text="Обработка...", foreground="blue")
-            self.root.update()
+        self.extract_status.config(text="Обработка...", foreground="blue")
+        self._start_task('extract', self._extract_worker, self.stego_image_path.get())
+
+    def _extract_worker(self, token, stego_path):
+
+        decoder = LSBDecoder(stego_path, progress=self._progress_handler('extract', token))
+        self.events.put(('extract', 'done', decoder.extract_data()))
 
-            decoder = LSBDecoder(self.stego_image_path.get())
-            extracted_message = decoder.extract_data()
+    def _on_extract_done(self, extracted_message):
 
-            self.extract_text.config(state='normal')
-            self.extract_text.delete('1.0', 'end')
-            self.extract_text.insert('1.0', extracted_message)
-            self.extract_text.config(state='disabled')
+        self.extract_text.config(state='normal')
+        self.extract_text.delete('1.0', 'end')
+        self.extract_text.insert('1.0', extracted_message)
+        self.extract_text.config(state='disabled')
 
-            self.extract_status.config(text="Извлечение завершено успешно", foreground="green")
-        except Exception as e:
-            self.extract_status.config(text=f"Ошибка: {e}", foreground="red")
-            messagebox.showerror("Ошибка", f"Ошибка при извлечении: {e}")
+        self.extract_progress['value'] = 100
+        self.extract_status.config(text="Извлечение завершено успешно", foreground="green")
 
     def copy_to_clipboard(self):
         
@@ -271,6 +444,9 @@ def main():
     root = tk.Tk()
     app = SteganographyGUI(root)
     root.mainloop()
+    # Незавершенная фоновая задача прерывается при закрытии окна
+    app.cancel_task()
+    app.executor.shutdown(wait=False)
 
 
 if __name__ == "__main__":
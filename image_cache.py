@@ -0,0 +1,184 @@
+"""
+Общий для процесса LRU-кэш декодированных пикселей.
+Кодер, декодер, метрики и стегоанализ получают пиксели через
+image_io.load_pixels, поэтому одно и то же изображение декодируется один раз.
+Ключ файла — путь, время изменения и размер; для недавно измененных файлов
+(время изменения может совпасть у двух записей подряд) и для байтов — хэш
+содержимого. Хэш записываемого изображения считается по ходу записи, поэтому
+только что сохраненный файл находится в кэше без повторного чтения; когда файл
+перестает быть недавно измененным, при первом обращении по ключу файла его
+содержимое один раз хэшируется, и запись переносится под этот ключ.
+Массивы в кэше доступны только для чтения и возвращаются без копирования;
+объем кэша ограничен бюджетом в байтах.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Файлы, измененные не раньше этого числа секунд назад, опознаются по содержимому
+RACY_SECONDS = 2.0
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def _content_key(data):
+
+    return 'content', hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _file_content_key(path):
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return 'content', digest.digest()
+
+
+class HashingWriter:
+    #Файловый объект, вычисляющий ключ по содержимому записываемых данных.
+
+    def __init__(self, file):
+        # fileno() намеренно не предоставляется: PIL пишет через write(), а не в дескриптор
+        self.file = file
+        self.digest = hashlib.blake2b(digest_size=16)
+
+    def write(self, data):
+
+        self.digest.update(data)
+        return self.file.write(data)
+
+    def flush(self):
+
+        self.file.flush()
+
+    def key(self):
+
+        return 'content', self.digest.digest()
+
+
+class ImageCache:
+    #LRU-кэш массивов пикселей с ограничением по объему.
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        # Записанные файлы: реальный путь -> ключ по содержимому записанных данных
+        self._written = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(source):
+        # None — источник не кэшируется (массивы, изображения PIL и файловые объекты).
+        # Время изменения недавно измененного файла может совпасть у двух записей
+        # подряд, поэтому такой файл опознается только по содержимому
+        if isinstance(source, (str, os.PathLike)):
+            stat = os.stat(source)
+            if time.time() - stat.st_mtime > RACY_SECONDS:
+                return 'file', os.path.realpath(source), stat.st_mtime_ns, stat.st_size
+            return _file_content_key(source)
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return _content_key(source)
+        return None
+
+    def get(self, key):
+
+        if key is None:
+            return None
+        with self._lock:
+            pixels = self._entries.get(key)
+            if pixels is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pixels
+            written = self._written.pop(key[1], None) if key[0] == 'file' else None
+            if written is None:
+                self.misses += 1
+                return None
+
+        # Записанный файл перестал быть недавно измененным: содержимое сверяется
+        # с записанным, и массив переносится под ключ файла
+        try:
+            matches = _file_content_key(key[1]) == written
+        except OSError:
+            matches = False
+        with self._lock:
+            pixels = self._entries.pop(written, None) if matches else None
+            if pixels is None:
+                self.misses += 1
+                return None
+            self._entries[key] = pixels
+            self.hits += 1
+            return pixels
+
+    def record_written(self, path, key):
+        # Файл path записан с ключом key по содержимому (массив уже помещен в кэш)
+        with self._lock:
+            if key in self._entries:
+                self._written[os.path.realpath(path)] = key
+
+    def put(self, key, pixels):
+        # Сохраняет представление массива только для чтения и возвращает его.
+        # Массив не копируется: после помещения в кэш его нельзя изменять
+        view = pixels.view()
+        view.flags.writeable = False
+        if key is None or view.nbytes > self.max_bytes:
+            return view
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous.nbytes
+            self._entries[key] = view
+            self.bytes += view.nbytes
+            self._evict()
+        return view
+
+    def _evict(self):
+        # Удаление давно не использованных массивов до соблюдения бюджета
+        while self.bytes > self.max_bytes:
+            key, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            if self._written:
+                self._written = {path: written for path, written in self._written.items()
+                                 if written != key}
+
+    def resize(self, max_bytes):
+        # Новый бюджет кэша; 0 отключает кэширование
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+            self._written.clear()
+            self.bytes = 0
+
+    def stats(self):
+
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+_cache = ImageCache()
+
+
+def get_cache():
+
+    return _cache
+
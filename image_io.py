@@ -0,0 +1,171 @@
+"""
+Загрузка и сохранение изображений для LSB Steganography.
+Источником может быть путь к файлу, байты, файлоподобный объект,
+изображение PIL или массив NumPy, поэтому обработка не требует
+временных файлов на диске.
+"""
+
+import io
+import os
+
+import numpy as np
+
+import instrumentation
+from bmp_mmap import map_bmp_pixels, probe_bmp
+from image_cache import HashingWriter, get_cache
+from png_stream import PNGStripReader
+
+
+def is_path(source):
+
+    return isinstance(source, (str, os.PathLike))
+
+
+def open_image(source):
+    #Открывает источник как изображение PIL (без принудительного декодирования).
+    # Pillow импортируется при первом обращении: массивы и BMP обходятся без него
+    from PIL import Image
+
+    if isinstance(source, Image.Image):
+        return source
+
+    if is_path(source):
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Файл {source} не найден")
+        return Image.open(source)
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+
+    if hasattr(source, 'read'):
+        return Image.open(source)
+
+    raise TypeError(f"Неподдерживаемый источник изображения: {type(source).__name__}")
+
+
+def load_rgb(source):
+    #Возвращает пару (изображение PIL в RGB, массив пикселей формы (H, W, 3)).
+    if isinstance(source, np.ndarray):
+        pixels = array_to_rgb(source)
+        return array_to_image(pixels), pixels
+
+    with instrumentation.current().stage('decode') as stage:
+        opened = open_image(source)
+        opened.load()
+        stage.add(pixels=opened.width * opened.height)
+    with instrumentation.current().stage('convert'):
+        image = opened.convert('RGB')
+        pixels = np.array(image)
+    # Многокадровые изображения держат файл открытым и после load()
+    if opened is not source:
+        opened.close()
+    return image, pixels
+
+
+def load_pixels(source):
+    # Возвращает (изображение PIL или None, пиксели (H, W, 3), раскладка BMP или None).
+    # Несжатые 24-битные BMP отображаются в память без декодирования и копирования.
+    # Пиксели файлов и байтов берутся из общего кэша (только для чтения)
+    if is_path(source):
+        layout = probe_bmp(source)
+        if layout is not None:
+            return None, map_bmp_pixels(source, layout), layout
+
+    if isinstance(source, np.ndarray):
+        # Изображение PIL для массива создается только по требованию
+        return None, array_to_rgb(source), None
+
+    cache = get_cache()
+    key = cache.key_for(source)
+    pixels = cache.get(key)
+    if pixels is not None:
+        return None, pixels, None
+
+    image, pixels = load_rgb(source)
+    return image, cache.put(key, pixels), None
+
+
+def load_leading_values(source, count):
+    # Возвращает (ширина, высота, первые count значений каналов RGB). Для PNG
+    # RGB/RGBA распаковываются только первые строки, для несжатых BMP читаются
+    # только эти строки файла; остальные форматы декодируются целиком
+    if isinstance(source, np.ndarray):
+        pixels = array_to_rgb(source)
+        return pixels.shape[1], pixels.shape[0], pixels.reshape(-1)[:count]
+
+    if is_path(source):
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Файл {source} не найден")
+        layout = probe_bmp(source)
+        if layout is not None:
+            rows = -(-count // (layout['width'] * 3))
+            pixels = map_bmp_pixels(source, layout)[:rows]
+            return layout['width'], layout['height'], np.array(pixels).reshape(-1)[:count]
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+
+    if is_path(source) or hasattr(source, 'seek'):
+        position = None if is_path(source) else source.tell()
+        try:
+            with PNGStripReader(source, 1) as reader:
+                rows = -(-count // (reader.width * 3))
+                reader.strip_rows = rows
+                pixels = next(reader.iter_strips())[1][:, :, :3]
+                return reader.width, reader.height, pixels.reshape(-1)[:count]
+        except (ValueError, StopIteration):
+            # Не PNG или неподдерживаемый вариант PNG: полное декодирование
+            if position is not None:
+                source.seek(position)
+
+    image, pixels = load_rgb(source)
+    return image.width, image.height, pixels.reshape(-1)[:count]
+
+
+def array_to_rgb(array):
+
+    if array.dtype != np.uint8:
+        raise ValueError("Массив пикселей должен иметь тип uint8")
+
+    if array.ndim == 3 and array.shape[2] == 4:
+        # Альфа-канал не используется, как и при convert('RGB')
+        array = array[:, :, :3]
+
+    if array.ndim != 3 or array.shape[2] != 3:
+        raise ValueError(f"Ожидался массив формы (H, W, 3), получен {array.shape}")
+
+    return np.ascontiguousarray(array)
+
+
+def array_to_image(pixels):
+
+    from PIL import Image
+    return Image.fromarray(np.ascontiguousarray(pixels), 'RGB')
+
+
+def save_image(pixels, output, format='PNG'):
+    # output: путь к файлу или файлоподобный объект с методом write
+    with instrumentation.current().stage('encode', bytes=pixels.nbytes):
+        array_to_image(pixels).save(output, format)
+
+
+def save_cached(pixels, output, format='PNG'):
+    # Запись изображения без потерь с помещением пикселей в кэш: ключ по
+    # содержимому считается по записываемым байтам, файл повторно не читается.
+    # Метрики и извлечение из этого файла не декодируют его повторно
+    if not is_path(output):
+        save_image(pixels, output, format)
+        return
+    with open(output, 'wb') as f:
+        writer = HashingWriter(f)
+        save_image(pixels, writer, format)
+    cache = get_cache()
+    cache.put(writer.key(), np.asarray(pixels))
+    cache.record_written(output, writer.key())
+
+
+def encode_image(pixels, format='PNG'):
+
+    buffer = io.BytesIO()
+    save_image(pixels, buffer, format)
+    return buffer.getvalue()
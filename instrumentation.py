@@ -0,0 +1,224 @@
+"""
+Замеры этапов встраивания, извлечения и расчета метрик.
+Кодер, декодер, загрузка изображений и метрики оборачивают этапы в
+current().stage(name, ...). По умолчанию установлен пустой сборщик: stage
+возвращает один и тот же объект-заглушку, и замеры ничего не стоят.
+Сборщик Instrumentation накапливает время, число вызовов и счетчики
+(байты, пиксели) по этапам, при необходимости — пик памяти tracemalloc
+и профиль cProfile (модули cProfile, pstats и tracemalloc импортируются,
+только когда эти замеры включены).
+
+Пример:
+    with collect() as stats:
+        LSBEncoder('image.png').embed_data('Hello', 'stego.png')
+    print(stats.format_summary())
+"""
+
+import io
+import threading
+import time
+from contextlib import contextmanager
+
+
+class _NullStage:
+    # Заглушка этапа: контекстный менеджер и add() без действий
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add(self, **counters):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullInstrumentation:
+    #Сборщик по умолчанию: ничего не измеряет.
+
+    enabled = False
+
+    def stage(self, name, **counters):
+
+        return _NULL_STAGE
+
+    def summary(self):
+
+        return {'stages': {}}
+
+    def format_summary(self):
+
+        return ''
+
+
+class _Stage:
+    # Замер одного выполнения этапа; counters дополняются через add()
+
+    __slots__ = ('owner', 'name', 'counters', 'start', 'peak')
+
+    def __init__(self, owner, name, counters):
+        self.owner = owner
+        self.name = name
+        self.counters = counters
+        self.peak = 0
+
+    def add(self, **counters):
+
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def __enter__(self):
+        self.owner._enter(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self.owner._exit(self, elapsed)
+        return False
+
+
+class Instrumentation(NullInstrumentation):
+    #Сборщик времени и счетчиков по этапам.
+
+    enabled = True
+
+    def __init__(self, profile=False, trace_memory=False, callback=None):
+        # profile: профилировать cProfile все этапы верхнего уровня;
+        # trace_memory: пик памяти tracemalloc для каждого этапа;
+        # callback: callback(name, seconds, counters) после каждого этапа
+        self.profile = None
+        if profile:
+            import cProfile
+
+            self.profile = cProfile.Profile()
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+
+        with self._lock:
+            self._stages = {}
+
+    def stage(self, name, **counters):
+
+        return _Stage(self, name, counters)
+
+    def _stack(self):
+
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self, stage):
+        # Для вложенных этапов пик памяти внешнего этапа сохраняется перед сбросом
+        stack = self._stack()
+        if self.trace_memory:
+            import tracemalloc
+
+            if not stack and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._local.started_tracing = True
+            if tracemalloc.is_tracing():
+                if stack:
+                    stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+        if not stack and self.profile is not None:
+            self.profile.enable()
+        stack.append(stage)
+
+    def _exit(self, stage, elapsed):
+
+        stack = self._stack()
+        stack.pop()
+        if not stack and self.profile is not None:
+            self.profile.disable()
+        if self.trace_memory:
+            import tracemalloc
+
+            if tracemalloc.is_tracing():
+                stage.peak = max(stage.peak, tracemalloc.get_traced_memory()[1])
+                if stack:
+                    stack[-1].peak = max(stack[-1].peak, stage.peak)
+            if not stack and getattr(self._local, 'started_tracing', False):
+                tracemalloc.stop()
+                self._local.started_tracing = False
+
+        with self._lock:
+            record = self._stages.setdefault(stage.name, {'calls': 0, 'seconds': 0.0})
+            record['calls'] += 1
+            record['seconds'] += elapsed
+            for key, value in stage.counters.items():
+                record[key] = record.get(key, 0) + value
+            if self.trace_memory:
+                record['peak_memory'] = max(record.get('peak_memory', 0), stage.peak)
+
+        if self.callback is not None:
+            self.callback(stage.name, elapsed, dict(stage.counters))
+
+    def summary(self):
+        # Этапы в порядке первого выполнения: время, число вызовов, счетчики
+        # и пропускная способность (МБ/с) для этапов со счетчиком байтов
+        with self._lock:
+            stages = {name: dict(record) for name, record in self._stages.items()}
+
+        for record in stages.values():
+            if record.get('bytes') and record['seconds'] > 0:
+                record['mb_per_second'] = record['bytes'] / 1e6 / record['seconds']
+        return {'stages': stages}
+
+    def format_summary(self):
+        # Одна строка для строки состояния: «load 12.3 мс, embed 4.1 мс (25.0 МБ/с), ...»
+        parts = []
+        for name, record in self.summary()['stages'].items():
+            text = f"{name} {record['seconds'] * 1000:.1f} мс"
+            if 'mb_per_second' in record:
+                text += f" ({record['mb_per_second']:.1f} МБ/с)"
+            parts.append(text)
+        return ', '.join(parts)
+
+    def profile_stats(self, limit=25, sort='cumulative'):
+        # Текстовый отчет cProfile (только при profile=True)
+        if self.profile is None:
+            return ''
+        import pstats
+
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+
+_NULL = NullInstrumentation()
+_current = _NULL
+
+
+def current():
+
+    return _current
+
+
+def install(instrumentation=None):
+    # Установка сборщика для всего процесса; None — пустой сборщик.
+    # Возвращает предыдущий сборщик
+    global _current
+    previous = _current
+    _current = instrumentation if instrumentation is not None else _NULL
+    return previous
+
+
+@contextmanager
+def collect(profile=False, trace_memory=False, callback=None):
+    # Временная установка нового сборщика на время блока with
+    instrumentation = Instrumentation(profile, trace_memory, callback)
+    previous = install(instrumentation)
+    try:
+        yield instrumentation
+    finally:
+        install(previous)
@@ -0,0 +1,329 @@
+"""
+Пакетное встраивание и извлечение для каталогов изображений.
+Файлы обрабатываются пулом процессов (по умолчанию по числу ядер),
+результаты выводятся построчно в формате JSON по мере готовности.
+
+Примеры:
+    python lsb_batch.py embed images/ stego/ --message "Hello World"
+    python lsb_batch.py extract stego/ --output-dir payloads/
+    python lsb_batch.py probe stego/ --chunksize 256
+    python lsb_batch.py scan incoming/ --window 65536
+    python lsb_batch.py shard images/ stego/ --payload-file archive.bin
+    python lsb_batch.py unshard stego/ --output archive.bin
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+
+from image_cache import get_cache
+from instrumentation import collect
+from lsb_decoder import LSBDecoder
+from lsb_encoder import LSBEncoder
+from lsb_shard import embed_shards, extract_shards
+from steganalysis import analyze
+
+
+IMAGE_EXTENSIONS = ('.png', '.bmp')
+
+# Параметры задания, передаваемые в процессы пула один раз при запуске
+_job = {}
+
+
+def iter_images(directory, extensions=IMAGE_EXTENSIONS, recursive=False):
+    # Ленивый обход каталога: пути выдаются по мере чтения, изображения не загружаются
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if recursive:
+                    yield from iter_images(entry.path, extensions, recursive)
+            elif entry.name.lower().endswith(extensions):
+                yield entry.path
+
+
+def _init_worker(job):
+    # Каждый файл пакета читается один раз: кэш пикселей в процессах пула не нужен
+    get_cache().resize(0)
+    _job.clear()
+    _job.update(job)
+
+
+def _output_path(path, directory, extension, input_dir=None):
+    # Путь относительно входного каталога сохраняется, чтобы одноименные файлы
+    # из разных подкаталогов не совпадали; исходное расширение остается в имени
+    # (x.png и x.bmp дают x.png.bin и x.bmp.bin), если оно отличается от нового
+    if input_dir is None:
+        name = os.path.basename(path)
+    else:
+        name = os.path.relpath(path, input_dir)
+    if not name.lower().endswith(extension):
+        name += extension
+    return os.path.join(directory, name)
+
+
+def _check_collisions(paths, directory, extension, input_dir):
+    # Ленивая проверка, что разные входные файлы не пишутся в один выходной
+    outputs = {}
+    for path in paths:
+        output_path = os.path.normcase(_output_path(path, directory, extension, input_dir))
+        if output_path in outputs:
+            raise ValueError(f"Файлы {outputs[output_path]} и {path} записываются в один "
+                             f"файл {output_path}")
+        outputs[output_path] = path
+        yield path
+
+
+def embed_file(path):
+
+    start = time.perf_counter()
+    result = {'file': path, 'operation': 'embed'}
+    try:
+        output_path = _output_path(path, _job['output_dir'], '.png', _job.get('input_dir'))
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        encoder = LSBEncoder(path, _job.get('bits_per_channel', 1), _job.get('key'),
+                             _job.get('compression'), _job.get('error_correction', False))
+        report = encoder.embed_bytes(_job['payload'], output_path, return_report=True)
+        result.update(status='ok', output=output_path, payload_bytes=len(_job['payload']),
+                      bits_flipped=report['bits_flipped'], mse=report['MSE'],
+                      psnr=None if math.isinf(report['PSNR']) else report['PSNR'])
+    except Exception as e:
+        result.update(status='error', error=str(e))
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def extract_file(path):
+
+    start = time.perf_counter()
+    result = {'file': path, 'operation': 'extract'}
+    try:
+        decoder = LSBDecoder(path, _job.get('key'))
+        payload = decoder.extract_bytes()
+        result.update(status='ok', payload_bytes=len(payload))
+        if decoder.fec_report is not None:
+            result['corrected_blocks'] = decoder.fec_report['corrected_blocks']
+        if _job.get('output_dir'):
+            output_path = _output_path(path, _job['output_dir'], '.bin', _job.get('input_dir'))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, 'wb') as f:
+                f.write(payload)
+            result['output'] = output_path
+        else:
+            result['message'] = payload.decode('utf-8', errors='replace')
+    except Exception as e:
+        result.update(status='error', error=str(e))
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def probe_file(path):
+    # Только заголовки файла и первые строки пикселей
+    result = {'file': path, 'operation': 'probe'}
+    try:
+        info = LSBDecoder.probe(path)
+        result.update(status='ok', **info)
+    except Exception as e:
+        result.update(status='error', error=str(e))
+    return result
+
+
+def scan_file(path):
+    # Оценки стегоанализа без попытки извлечения
+    start = time.perf_counter()
+    result = {'file': path, 'operation': 'scan'}
+    try:
+        result.update(status='ok', **analyze(path, _job.get('window')))
+    except Exception as e:
+        result.update(status='error', error=str(e))
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    return result
+
+
+_TASKS = {'embed': embed_file, 'extract': extract_file, 'probe': probe_file, 'scan': scan_file}
+
+
+def instrumented_file(path):
+    # Задача с замером этапов: к результату добавляется сводка по этапам
+    with collect() as stats:
+        result = _TASKS[_job['operation']](path)
+    result['stages'] = stats.summary()['stages']
+    return result
+
+
+def run_batch(operation, paths, job, workers=None, chunksize=16):
+    # Генератор результатов в порядке завершения; пути передаются пулу порциями.
+    # При job['stats'] каждый результат дополняется временем этапов
+    task = _TASKS[operation]
+    if job.get('stats'):
+        job = dict(job, operation=operation)
+        task = instrumented_file
+    workers = workers or os.cpu_count() or 1
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(job,)) as pool:
+        yield from pool.imap_unordered(task, paths, chunksize)
+
+
+def _add_payload_arguments(sub):
+
+    sub.add_argument('input_dir')
+    sub.add_argument('output_dir')
+    payload_group = sub.add_mutually_exclusive_group(required=True)
+    payload_group.add_argument('--message', help="текст для встраивания")
+    payload_group.add_argument('--payload-file', help="файл с двоичными данными")
+    sub.add_argument('--bits-per-channel', type=int, default=1, choices=range(1, 5),
+                     help="число младших бит канала под нагрузку")
+    sub.add_argument('--compression', choices=('auto', 'zlib', 'bz2', 'lzma'),
+                     help="сжатие нагрузки перед встраиванием")
+    sub.add_argument('--error-correction', action='store_true',
+                     help="помехоустойчивое кодирование нагрузки (CRC32 и код Хэмминга)")
+
+
+def _read_payload(args):
+
+    if args.payload_file:
+        with open(args.payload_file, 'rb') as f:
+            return f.read()
+    return args.message.encode('utf-8')
+
+
+def _write_result(result):
+
+    sys.stdout.write(json.dumps(result, ensure_ascii=False) + '\n')
+    sys.stdout.flush()
+
+
+def run_shard(args):
+    # Части записываются в контейнеры в порядке сортировки имен файлов
+    sources = sorted(iter_images(args.input_dir, recursive=args.recursive))
+    try:
+        sources = list(_check_collisions(sources, args.output_dir, '.png', args.input_dir))
+    except ValueError as e:
+        _write_result({'operation': 'shard', 'status': 'error', 'error': str(e)})
+        return 1
+    outputs = [_output_path(path, args.output_dir, '.png', args.input_dir) for path in sources]
+    for output_path in outputs:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    payload = _read_payload(args)
+
+    start = time.perf_counter()
+    try:
+        reports = embed_shards(payload, sources, outputs, args.bits_per_channel, args.key,
+                               args.compression, args.workers, args.error_correction)
+    except Exception as e:
+        _write_result({'operation': 'shard', 'status': 'error', 'error': str(e)})
+        return 1
+
+    for index, report in enumerate(reports):
+        _write_result({'file': sources[index], 'operation': 'shard', 'status': 'ok',
+                       'shard': index + 1, 'shards': len(reports), 'output': report['output'],
+                       'bits_flipped': report['bits_flipped'], 'mse': report['MSE']})
+    _write_result({'operation': 'shard', 'status': 'ok', 'payload_bytes': len(payload),
+                   'shards': len(reports), 'seconds': round(time.perf_counter() - start, 6)})
+    return 0
+
+
+def run_unshard(args):
+
+    paths = list(iter_images(args.input_dir, recursive=args.recursive))
+    start = time.perf_counter()
+    try:
+        payload = extract_shards(paths, args.key, args.workers)
+    except Exception as e:
+        _write_result({'operation': 'unshard', 'status': 'error', 'error': str(e)})
+        return 1
+
+    with open(args.output, 'wb') as f:
+        f.write(payload)
+    _write_result({'operation': 'unshard', 'status': 'ok', 'output': args.output,
+                   'payload_bytes': len(payload), 'seconds': round(time.perf_counter() - start, 6)})
+    return 0
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Пакетная LSB-стеганография")
+    subparsers = parser.add_subparsers(dest='operation', required=True)
+
+    embed_parser = subparsers.add_parser('embed', help="встраивание в каталог изображений")
+    _add_payload_arguments(embed_parser)
+
+    extract_parser = subparsers.add_parser('extract', help="извлечение из каталога изображений")
+    extract_parser.add_argument('input_dir')
+    extract_parser.add_argument('--output-dir', help="каталог для извлеченных данных (.bin)")
+
+    probe_parser = subparsers.add_parser(
+        'probe', help="проверка наличия нагрузки по заголовкам без декодирования изображений")
+    probe_parser.add_argument('input_dir')
+
+    scan_parser = subparsers.add_parser(
+        'scan', help="поиск скрытой нагрузки (хи-квадрат и RS-анализ) без извлечения")
+    scan_parser.add_argument('input_dir')
+    scan_parser.add_argument('--window', type=int,
+                             help="размер окна в значениях каналов для поиска области нагрузки")
+
+    shard_parser = subparsers.add_parser(
+        'shard', help="распределение одной нагрузки по изображениям каталога")
+    _add_payload_arguments(shard_parser)
+
+    unshard_parser = subparsers.add_parser(
+        'unshard', help="сборка распределенной нагрузки из изображений каталога")
+    unshard_parser.add_argument('input_dir')
+    unshard_parser.add_argument('--output', required=True, help="файл для собранной нагрузки")
+
+    for sub in (embed_parser, extract_parser, probe_parser, scan_parser, shard_parser,
+                unshard_parser):
+        sub.add_argument('--workers', type=int, default=None,
+                         help="число процессов (по умолчанию по числу ядер)")
+        sub.add_argument('--recursive', action='store_true', help="обходить подкаталоги")
+        sub.add_argument('--key', help="секретный ключ рассеивания нагрузки по изображению")
+
+    # shard и unshard обрабатывают по одной части на процесс и не собирают этапы,
+    # поэтому порции и статистика есть только у пофайловых операций
+    for sub in (embed_parser, extract_parser, probe_parser, scan_parser):
+        sub.add_argument('--chunksize', type=int, default=16,
+                         help="число файлов в одной порции задания")
+        sub.add_argument('--stats', action='store_true',
+                         help="добавлять к результатам время и счетчики этапов обработки")
+
+    args = parser.parse_args(argv)
+
+    if args.operation == 'shard':
+        return run_shard(args)
+    if args.operation == 'unshard':
+        return run_unshard(args)
+
+    job = {'output_dir': getattr(args, 'output_dir', None), 'input_dir': args.input_dir,
+           'key': args.key, 'stats': args.stats}
+    if args.operation == 'embed':
+        job['bits_per_channel'] = args.bits_per_channel
+        job['compression'] = args.compression
+        job['error_correction'] = args.error_correction
+        job['payload'] = _read_payload(args)
+    elif args.operation == 'scan':
+        job['window'] = args.window
+
+    if job['output_dir']:
+        os.makedirs(job['output_dir'], exist_ok=True)
+
+    paths = iter_images(args.input_dir, recursive=args.recursive)
+    if job['output_dir']:
+        extension = '.png' if args.operation == 'embed' else '.bin'
+        paths = _check_collisions(paths, job['output_dir'], extension, args.input_dir)
+    failed = 0
+    try:
+        for result in run_batch(args.operation, paths, job, args.workers, args.chunksize):
+            failed += result['status'] != 'ok'
+            _write_result(result)
+    except ValueError as e:
+        _write_result({'operation': args.operation, 'status': 'error', 'error': str(e)})
+        return 1
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Сжатие полезной нагрузки перед встраиванием.
+Используются стандартные алгоритмы zlib, bz2 и lzma; в режиме 'auto'
+алгоритм выбирается по степени сжатия начального фрагмента нагрузки.
+Распаковка выполняется потоково, порциями по мере чтения из изображения.
+"""
+
+import bz2
+import lzma
+import zlib
+
+from lsb_format import CODEC_NAMES
+
+
+# Размер начального фрагмента нагрузки для выбора алгоритма в режиме 'auto'
+SAMPLE_SIZE = 64 * 1024
+# Наибольший размер распакованных данных за один шаг распаковки
+DECOMPRESS_BLOCK_SIZE = 1 << 20
+
+_COMPRESSORS = {
+    'zlib': lambda data: zlib.compress(data, 9),
+    'bz2': lambda data: bz2.compress(data, 9),
+    'lzma': lambda data: lzma.compress(data, preset=6),
+}
+
+_DECOMPRESSORS = {
+    'zlib': zlib.decompressobj,
+    'bz2': bz2.BZ2Decompressor,
+    'lzma': lzma.LZMADecompressor,
+}
+
+
+def choose_codec(payload):
+    # Алгоритм с наименьшим размером сжатого фрагмента или 'none',
+    # если ни один из них не уменьшает данные
+    sample = bytes(memoryview(payload).cast('B')[:SAMPLE_SIZE])
+    best, best_size = 'none', len(sample)
+    for codec, compress in _COMPRESSORS.items():
+        size = len(compress(sample))
+        if size < best_size:
+            best, best_size = codec, size
+    return best
+
+
+def compress_payload(payload, codec='auto'):
+    # Возвращает (алгоритм, данные для записи). Если сжатие не уменьшило
+    # нагрузку, она записывается как есть с алгоритмом 'none'
+    if codec is None:
+        codec = 'none'
+    if codec == 'auto':
+        codec = choose_codec(payload)
+    if codec not in CODEC_NAMES:
+        raise ValueError(f"Неизвестный алгоритм сжатия: {codec}")
+    if codec == 'none':
+        return codec, payload
+
+    data = _COMPRESSORS[codec](payload)
+    if len(data) >= memoryview(payload).nbytes:
+        return 'none', payload
+    return codec, data
+
+
+def _decompress_steps(decompressor, codec, chunk):
+    # Распаковка порции шагами не больше DECOMPRESS_BLOCK_SIZE байт, чтобы
+    # небольшие сжатые данные не разворачивались в память целиком за один вызов
+    if codec == 'zlib':
+        yield decompressor.decompress(chunk, DECOMPRESS_BLOCK_SIZE)
+        while decompressor.unconsumed_tail:
+            yield decompressor.decompress(decompressor.unconsumed_tail, DECOMPRESS_BLOCK_SIZE)
+        return
+
+    yield decompressor.decompress(chunk, DECOMPRESS_BLOCK_SIZE)
+    while not decompressor.eof and not decompressor.needs_input:
+        yield decompressor.decompress(b'', DECOMPRESS_BLOCK_SIZE)
+
+
+def _limited(parts, max_size):
+    # Остановка, как только распакованные данные превышают max_size байт
+    total = 0
+    for part in parts:
+        total += len(part)
+        if max_size is not None and total > max_size:
+            raise ValueError(f"Распакованная нагрузка превышает {max_size} байт")
+        yield part
+
+
+def decompress_chunks(chunks, codec, max_size=None):
+    # Потоковая распаковка: chunks — итератор порций сжатых данных;
+    # max_size — предельный размер распакованной нагрузки (ValueError при превышении)
+    if codec == 'none':
+        yield from _limited(chunks, max_size)
+        return
+
+    decompressor = _DECOMPRESSORS[codec]()
+
+    def parts():
+        for chunk in chunks:
+            if chunk and not decompressor.eof:
+                yield from _decompress_steps(decompressor, codec, chunk)
+        if codec == 'zlib':
+            yield decompressor.flush()
+
+    yield from _limited(parts(), max_size)
+    if not decompressor.eof:
+        raise ValueError("Сжатые данные нагрузки обрезаны")
@@ -1,63 +1,257 @@
-from PIL import Image
 import numpy as np
 import os
+import zlib
+
+import instrumentation
+from image_io import array_to_image, is_path, load_leading_values, load_pixels
+from lsb_compress import decompress_chunks
+from lsb_fec import UncorrectableError, correct_frames
+from lsb_format import (FLAG_FEC, FLAG_MULTIFRAME, FLAG_SCATTER, FLAG_SHARD, HEADER_BITS, HEADER_SIZE,
+                        LEGACY_END_MARKER, SHARD_HEADER_SIZE, capacity_bytes, parse_header,
+                        parse_shard_header, symbol_count, unpack_symbols)
+from lsb_multiframe import read_frames, source_frame_sizes
+from lsb_progress import CancelledError, report_progress
+from lsb_scatter import scatter_positions
 
 
 class LSBDecoder:
-    
-    def __init__(self, stego_image_path):
-        
-        if not os.path.exists(stego_image_path):
-            raise FileNotFoundError(f"Файл {stego_image_path} не найден")
+
+    # Размеры порций (в байтах сообщения) при поиске маркера конца старого формата
+    INITIAL_CHUNK_BYTES = 256
+    MAX_CHUNK_BYTES = 1 << 20
+    # Число значений каналов в порции при чтении нагрузки (кратно 8 для любой глубины)
+    PAYLOAD_CHUNK_VALUES = 1 << 23
+
+    def __init__(self, stego_image_source, key=None, progress=None, max_size=None):
+        # stego_image_source: путь, bytes, файлоподобный объект, изображение PIL или массив NumPy;
+        # key: ключ, с которым нагрузка была рассеяна при встраивании;
+        # progress: обработчик progress(done, total) хода чтения, может вызвать CancelledError;
+        # max_size: предельный размер распакованной нагрузки в байтах (None — без ограничения)
+        if is_path(stego_image_source) and not os.path.exists(stego_image_source):
+            raise FileNotFoundError(f"Файл {stego_image_source} не найден")
+
+        self.source = stego_image_source
+        self.key = key
+        self.progress = progress
+        self.max_size = max_size
+        # Отчет помехоустойчивого декодирования последней извлеченной нагрузки:
+        # число блоков, исправленных и неисправимых блоков
+        self.fec_report = None
+        # Заголовок последней извлеченной нагрузки (None — старый формат с маркером [END])
+        self.header = None
 
         try:
-            self.image = Image.open(stego_image_path)
-            # Конвертируем в RGB для единообразного формата
-            self.image = self.image.convert('RGB')
-            self.pixels = np.array(self.image)
+            # Конвертируем в RGB для единообразного формата; несжатые BMP
+            # отображаются в память и читаются только нужные строки
+            with instrumentation.current().stage('load') as stage:
+                self._image, self.pixels, self.bmp_layout = load_pixels(stego_image_source)
+                stage.add(pixels=self.pixels.shape[0] * self.pixels.shape[1])
             self.height, self.width = self.pixels.shape[:2]
         except Exception as e:
             raise Exception(f"Ошибка при загрузке изображения: {str(e)}")
 
-    def extract_data(self):
-        
-        try:
-            # Создание плоского представления массива пикселей
-            pixels_flat = self.pixels.reshape(-1)
-
-            # Извлечение младшего бита из каждого элемента
-            # Операция & 1 извлекает последний бит (если 1, то значение нечетное)
-            binary_message = ''.join(str(pixel & 1) for pixel in pixels_flat)
-
-            # Преобразование бинарной последовательности в текст
-            message = ''
-            for i in range(0, len(binary_message), 8):
-                # Взятие группы из 8 бит (одного байта)
-                byte = binary_message[i:i+8]
-
-                if len(byte) == 8:
-                    # Преобразование двоичного кода в символ ASCII
-                    try:
-                        char = chr(int(byte, 2))
-                        message += char
-                    except ValueError:
-                        # Пропуск некорректных кодов
-                        continue
-
-                    # Проверка на маркер конца
-                    if message.endswith('[END]'):
-                        # Возврат сообщения без маркера конца
-                        return message[:-5]
-
-            # Если маркер конца не найден
-            if message:
-                return message
+    @staticmethod
+    def probe(stego_image_source):
+        # Наличие и параметры заголовка нагрузки по первым строкам изображения,
+        # без декодирования остальных пикселей
+        width, height, values = load_leading_values(stego_image_source, HEADER_BITS)
+        header = None
+        if values.size == HEADER_BITS:
+            header = parse_header(unpack_symbols(values, HEADER_SIZE))
+
+        info = {
+            'width': width,
+            'height': height,
+            'size': f"{width}×{height}",
+            'has_header': header is not None
+        }
+        if header is not None:
+            flags = header['flags']
+            # Нагрузка многокадрового контейнера распределена по всем кадрам
+            channel_count = width * height * 3
+            if flags & FLAG_MULTIFRAME:
+                channel_count = sum(w * h * 3 for w, h in source_frame_sizes(stego_image_source))
+            info.update(
+                length=header['length'],
+                bits_per_channel=header['bits_per_channel'],
+                codec=header['codec'],
+                scattered=bool(flags & FLAG_SCATTER),
+                error_correction=bool(flags & FLAG_FEC),
+                shard=bool(flags & FLAG_SHARD),
+                multiframe=bool(flags & FLAG_MULTIFRAME),
+                # Длина, не помещающаяся в изображение, означает случайное совпадение сигнатуры
+                valid=header['length'] <= capacity_bytes(channel_count, header['bits_per_channel'])
+            )
+        return info
+
+    @property
+    def image(self):
+
+        if self._image is None:
+            self._image = array_to_image(self.pixels)
+        return self._image
+
+    def channel_values(self, start, end):
+        # Значения каналов с номерами [start, end) в порядке встраивания;
+        # копируются только строки, содержащие этот диапазон
+        row_size = self.width * 3
+        first_row = start // row_size
+        last_row = -(-end // row_size)
+        block = self.pixels[first_row:last_row].reshape(-1)
+        offset = first_row * row_size
+        return block[start - offset:end - offset]
+
+    def gather_values(self, positions):
+        # Значения каналов по произвольным номерам (для рассеянной нагрузки)
+        if self.pixels.flags.c_contiguous:
+            return self.pixels.reshape(-1)[positions]
+        return self.pixels[np.unravel_index(positions, self.pixels.shape)]
+
+    def read_bytes(self, start_bit, count):
+        # Чтение count байт из младших бит, начиная со значения канала start_bit
+        end_bit = start_bit + count * 8
+        if end_bit > self.pixels.size:
+            raise ValueError("Длина нагрузки превышает вместимость изображения")
+        return np.packbits(self.channel_values(start_bit, end_bit) & 1).tobytes()
+
+    def read_header(self):
+        # Заголовок контейнера или None для старого формата с маркером [END]
+        return parse_header(self.read_bytes(0, HEADER_BITS // 8))
+
+    def iter_stored_chunks(self, header):
+        # Записанные байты нагрузки (возможно, сжатые) порциями по PAYLOAD_CHUNK_VALUES
+        # значений каналов после заголовка по bits_per_channel бит на канал
+        bits_per_channel = header['bits_per_channel']
+        count = symbol_count(header['length'], bits_per_channel)
+        if HEADER_BITS + count > self.pixels.size:
+            raise ValueError("Длина нагрузки превышает вместимость изображения")
+
+        scattered = header['flags'] & FLAG_SCATTER
+        if scattered and self.key is None:
+            raise ValueError("Нагрузка рассеяна по ключу: для извлечения требуется ключ")
+
+        remaining = header['length']
+        for start in range(0, count, self.PAYLOAD_CHUNK_VALUES):
+            end = min(start + self.PAYLOAD_CHUNK_VALUES, count)
+            if scattered:
+                # Позиции символов восстанавливаются по тому же ключу, что и при встраивании
+                positions = scatter_positions(self.key, end - start, HEADER_BITS,
+                                              self.pixels.size, start, count)
+                values = self.gather_values(positions)
             else:
-                return ""
+                values = self.channel_values(HEADER_BITS + start, HEADER_BITS + end)
+            chunk_length = min(remaining, (end - start) * bits_per_channel // 8)
+            remaining -= chunk_length
+            yield unpack_symbols(values, chunk_length, bits_per_channel)
+            report_progress(self.progress, end, count)
+
+    def read_payload(self, header):
+        # Сжатая нагрузка распаковывается потоково по мере чтения порций
+        if header['flags'] & FLAG_SHARD:
+            info, data = self.read_shard(header)
+            if info['count'] != 1:
+                raise ValueError(
+                    f"Изображение содержит часть {info['index'] + 1} из {info['count']} "
+                    f"распределенной нагрузки"
+                )
+            if info['error_correction']:
+                data = self.correct_errors(data)
+            return b''.join(decompress_chunks([data], header['codec'], self.max_size))
+
+        if header['flags'] & FLAG_MULTIFRAME:
+            # Остальные кадры читаются из источника по одному
+            chunks = [read_frames(self.source, header, self.pixels, self.progress)]
+        else:
+            chunks = self.iter_stored_chunks(header)
+        if header['flags'] & FLAG_FEC:
+            chunks = [self.correct_errors(b''.join(chunks))]
+        return b''.join(decompress_chunks(chunks, header['codec'], self.max_size))
+
+    def correct_errors(self, data):
+        # Исправление ошибок по блокам; при неисправимых блоках нагрузка не возвращается
+        with instrumentation.current().stage('fec', bytes=len(data)):
+            try:
+                data, self.fec_report = correct_frames(data)
+            except UncorrectableError as e:
+                self.fec_report = e.report
+                raise
+        return data
+
+    def read_shard(self, header=None):
+        # Часть распределенной нагрузки: (сведения о части, данные части без распаковки)
+        header = header or self.read_header()
+        if header is None or not header['flags'] & FLAG_SHARD:
+            raise ValueError("Изображение не содержит части распределенной нагрузки")
 
+        stored = b''.join(self.iter_stored_chunks(header))
+        info = parse_shard_header(stored)
+        data = stored[SHARD_HEADER_SIZE:]
+        info['codec'] = header['codec']
+        info['error_correction'] = bool(header['flags'] & FLAG_FEC)
+        # При помехоустойчивом кодировании ошибки исправляются после сборки частей
+        if zlib.crc32(data) != info['crc32'] and not info['error_correction']:
+            raise ValueError("Контрольная сумма части нагрузки не совпадает")
+        return info, data
+
+    def extract_bytes(self):
+        # Возвращает полезную нагрузку в виде bytes без преобразования в текст
+        try:
+            with instrumentation.current().stage('extract') as stage:
+                # Автоопределение формата: заголовок с длиной или старый маркер [END]
+                header = self.read_header()
+                self.header = header
+                if header is None:
+                    payload = self.extract_legacy()
+                else:
+                    # Длина известна заранее: читаем ровно заголовок + N байт
+                    payload = self.read_payload(header)
+                stage.add(bytes=len(payload))
+            return payload
+
+        except CancelledError:
+            raise
         except Exception as e:
             raise Exception(f"Ошибка при извлечении: {str(e)}")
 
+    def extract_data(self):
+        # Возвращает полезную нагрузку в виде текста
+        payload = self.extract_bytes()
+        # Старый формат хранил по одному байту на символ
+        if self.header is None:
+            return payload.decode('latin-1')
+        return payload.decode('utf-8', errors='replace')
+
+    def extract_legacy(self):
+        marker = LEGACY_END_MARKER
+        data = bytearray()
+
+        # Чтение младших бит порциями: первая порция маленькая, чтобы короткие
+        # сообщения извлекались без обхода всего изображения, далее порции растут
+        chunk_bytes = self.INITIAL_CHUNK_BYTES
+        position = 0
+        total = self.pixels.size - self.pixels.size % 8
+
+        while position < total:
+            end = min(position + chunk_bytes * 8, total)
+
+            # Операция & 1 извлекает последний бит, packbits собирает по 8 бит в байт
+            chunk = np.packbits(self.channel_values(position, end) & 1)
+
+            # Поиск маркера с учетом того, что он мог начаться в предыдущей порции
+            search_from = max(0, len(data) - len(marker) + 1)
+            data += chunk.tobytes()
+            index = data.find(marker, search_from)
+            if index != -1:
+                # Возврат сообщения без маркера конца
+                return bytes(data[:index])
+
+            position = end
+            chunk_bytes = min(chunk_bytes * 2, self.MAX_CHUNK_BYTES)
+            report_progress(self.progress, position, total)
+
+        # Если маркер конца не найден, возвращаем все прочитанные данные
+        return bytes(data)
+
     def get_image_info(self):
         
         return {
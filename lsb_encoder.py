@@ -1,91 +1,381 @@
-from PIL import Image
 import numpy as np
+import math
 import os
+import shutil
+
+import instrumentation
+from bmp_mmap import map_bmp_pixels
+from image_io import array_to_image, encode_image, is_path, load_pixels, open_image, save_cached
+from lsb_compress import compress_payload
+from lsb_fec import data_capacity, encode_payload
+from lsb_format import (FLAG_SCATTER, HEADER_BITS, LEGACY_END_MARKER, bytes_to_bits,
+                        capacity_bytes, codec_flags, container_symbols, depth_flags, set_lsb)
+from lsb_multiframe import frame_sizes, frames_capacity
+from lsb_progress import CancelledError, report_progress
+from lsb_scatter import scatter_positions
+
+
+# Число единичных бит в каждом значении байта (для подсчета измененных бит)
+BIT_COUNTS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1, dtype=np.uint8)
 
 
 class LSBEncoder:
     #Класс для встраивания информации в изображение методом LSB.
 
-    def __init__(self, image_path):
-       
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Файл {image_path} не найден")
+    # Число значений каналов, записываемых за один шаг (между вызовами progress)
+    WRITE_CHUNK_VALUES = 1 << 22
+
+    def __init__(self, image_source, bits_per_channel=1, key=None, compression=None,
+                 error_correction=False, progress=None):
+        # image_source: путь, bytes, файлоподобный объект, изображение PIL или массив NumPy;
+        # bits_per_channel: число младших бит (1-4) каждого канала под нагрузку;
+        # key: секретный ключ (str, bytes или int) для псевдослучайного рассеивания нагрузки;
+        # compression: None, 'zlib', 'bz2', 'lzma' или 'auto' (выбор по фрагменту нагрузки);
+        # error_correction: блоки с CRC32 и код Хэмминга (7,4) для исправления одиночных ошибок;
+        # progress: обработчик progress(done, total) хода записи, может вызвать CancelledError
+        if is_path(image_source) and not os.path.exists(image_source):
+            raise FileNotFoundError(f"Файл {image_source} не найден")
+
+        depth_flags(bits_per_channel)
+        if compression not in (None, 'auto'):
+            codec_flags(compression)
+        self.bits_per_channel = bits_per_channel
+        self.key = key
+        self.compression = compression
+        self.error_correction = error_correction
+        self.progress = progress
+        # Дополнительные флаги заголовка (устанавливаются, например, при разбиении на части)
+        self.header_flags = 0
 
         try:
-            self.image = Image.open(image_path)
-            self.image = self.image.convert('RGB')
-            self.pixels = np.array(self.image)
+            # Для несжатых BMP pixels — отображение файла в память (только чтение)
+            with instrumentation.current().stage('load') as stage:
+                self._image, self.pixels, self.bmp_layout = load_pixels(image_source)
+                stage.add(pixels=self.pixels.shape[0] * self.pixels.shape[1])
+            self.source_path = image_source if is_path(image_source) else None
             self.height, self.width = self.pixels.shape[:2]
         except Exception as e:
             raise Exception(f"Ошибка при загрузке изображения: {str(e)}")
 
+    @staticmethod
+    def probe(image_source, bits_per_channel=1):
+        # Размеры, режим и вместимость по заголовку файла, без декодирования пикселей
+        depth_flags(bits_per_channel)
+        if isinstance(image_source, np.ndarray):
+            height, width = image_source.shape[:2]
+            mode, image_format = 'RGB', None
+            sizes = [(width, height)]
+        else:
+            image = open_image(image_source)
+            width, height = image.size
+            mode, image_format = image.mode, image.format
+            sizes = frame_sizes(image)
+            if image is not image_source:
+                image.close()
+
+        return {
+            'width': width,
+            'height': height,
+            'size': f"{width}×{height}",
+            'mode': mode,
+            'format': image_format,
+            'capacity': capacity_bytes(width * height * 3, bits_per_channel),
+            # Вместимость при встраивании во все кадры (lsb_multiframe.embed_frames)
+            'frames': len(sizes),
+            'frames_capacity': frames_capacity(sizes, bits_per_channel),
+            'bits_per_channel': bits_per_channel,
+            'total_pixels': width * height,
+            'total_bits': width * height * 3 * bits_per_channel
+        }
+
+    @property
+    def image(self):
+        # Изображение PIL создается только при обращении (для BMP и массивов)
+        if self._image is None:
+            self._image = array_to_image(self.pixels)
+        return self._image
+
     def text_to_binary(self, text):
-        
-        binary_text = ''.join(format(ord(c), '08b') for c in text)
+        # Текст кодируется в UTF-8, поэтому каждый байт занимает ровно 8 бит
+        binary_text = ''.join(format(byte, '08b') for byte in text.encode('utf-8'))
         return binary_text
 
     def binary_to_text(self, binary):
         
-        text = ''
-        for i in range(0, len(binary), 8):
-            byte = binary[i:i+8]
-            if len(byte) == 8:
-                text += chr(int(byte, 2))
-        return text
-
-    def calculate_capacity(self):
-       
-        total_bits = self.height * self.width * 3  
-        total_bytes = total_bits // 8
-        capacity = max(0, total_bytes - 10)
-        return capacity
-
-    def embed_data(self, message, output_path='stego_image.png'):
-      
-        capacity = self.calculate_capacity()
-        if len(message) > capacity:
-            raise ValueError(
-                f"Размер сообщения ({len(message)} символов) превышает вместимость "
-                f"контейнера ({capacity} символов)"
-            )
+        data = bytes(int(binary[i:i+8], 2) for i in range(0, len(binary) - 7, 8))
+        return data.decode('utf-8', errors='replace')
+
+    def calculate_capacity(self, bits_per_channel=None, payload=None):
+        # Вместимость в байтах полезной нагрузки при заданной глубине встраивания;
+        # заголовок контейнера (10 байт) занимает по одному биту в первых 80 каналах.
+        # При помехоустойчивом кодировании учитывается его избыточность.
+        # Если включено сжатие и передан payload, возвращается эффективная вместимость:
+        # сколько байт данных такого вида поместится с учетом степени их сжатия
+        capacity = self.stored_capacity(bits_per_channel)
+        if self.error_correction:
+            capacity = data_capacity(capacity)
+        if payload is None or self.compression is None:
+            return capacity
+
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        size = memoryview(payload).nbytes
+        stored = len(compress_payload(payload, self.compression)[1])
+        if size == 0 or stored >= size:
+            return capacity
+        return capacity * size // stored
+
+    def stored_capacity(self, bits_per_channel=None):
+        # Вместимость для записываемых байтов (после сжатия и кодирования)
+        bits_per_channel = bits_per_channel or self.bits_per_channel
+        return capacity_bytes(self.height * self.width * 3, bits_per_channel)
+
+    def prepare_payload(self, payload):
+        # Нагрузка в виде, в котором она записывается, и флаги заголовка
+        payload, flags = encode_payload(payload, self.compression, self.error_correction)
+        flags |= self.header_flags | (FLAG_SCATTER if self.key is not None else 0)
+        return payload, flags
+
+    def embed_bits(self, bits, report=None, masks=np.uint8(1), positions=None):
+        # Возвращает копию пикселей с записанными битами, исходные пиксели не меняются
+        with instrumentation.current().stage('copy', bytes=self.pixels.nbytes):
+            modified_pixels = np.array(self.pixels)
+        self.write_bits(modified_pixels, bits, report, masks, positions)
+        return modified_pixels
+
+    def write_bits(self, pixels, bits, report=None, masks=np.uint8(1), positions=None):
+        # Запись бит в пиксели на месте. Затрагиваются только строки, в которые
+        # попадают биты, поэтому для отображенного в память файла читаются
+        # и записываются лишь эти строки. masks задает заменяемые младшие разряды
+        # каждого значения (по умолчанию один бит), positions — номера значений
+        # каналов для рассеянной записи. Если передан словарь report,
+        # в него записывается статистика изменений
+        if bits.size > pixels.size:
+            raise ValueError("Данные не помещаются в изображение")
+
+        with instrumentation.current().stage('embed', values=bits.size):
+            if positions is not None:
+                self.write_scattered(pixels, bits, report, masks, positions)
+            else:
+                self.write_sequential(pixels, bits, report, masks)
+
+    def write_sequential(self, pixels, bits, report, masks):
+        # Запись порциями подряд идущих значений каналов
+        row_size = self.width * 3
+        original_parts = []
+        new_parts = []
+        for start in range(0, bits.size, self.WRITE_CHUNK_VALUES):
+            end = min(start + self.WRITE_CHUNK_VALUES, bits.size)
+            first_row = start // row_size
+            last_row = -(-end // row_size)
+            block = np.array(pixels[first_row:last_row])
+            offset = start - first_row * row_size
+            values = block.reshape(-1)[offset:offset + end - start]
+            if report is not None:
+                original_parts.append(values.copy())
+
+            # Запись порции одной векторной операцией: обнуляем младшие разряды
+            # значений каналов и подставляем биты сообщения
+            set_lsb(values, bits[start:end], masks if masks.ndim == 0 else masks[start:end])
+            pixels[first_row:last_row] = block
+            if report is not None:
+                new_parts.append(values)
+            report_progress(self.progress, end, bits.size)
+
+        if report is not None:
+            report.update(self.change_report(np.concatenate(original_parts or [bits[:0]]),
+                                             np.concatenate(new_parts or [bits[:0]]),
+                                             self.bits_written(bits.size, masks)))
+
+    def write_scattered(self, pixels, bits, report, masks, positions):
+        # Сбор и запись значений по произвольным позициям расширенной индексацией;
+        # для отображенного в память BMP индексы переводятся в (строка, столбец, канал)
+        if pixels.flags.c_contiguous:
+            target = pixels.reshape(-1)
+            index = positions
+        else:
+            target = pixels
+            index = np.unravel_index(positions, pixels.shape)
+
+        values = target[index]
+        original_values = values.copy() if report is not None else None
+        set_lsb(values, bits, masks)
+        target[index] = values
+        report_progress(self.progress, bits.size, bits.size)
+
+        if report is not None:
+            report.update(self.change_report(original_values, values,
+                                             self.bits_written(bits.size, masks), positions))
+
+    def bits_written(self, count, masks):
+        # Число записанных бит: маска одна для всех значений или маски контейнера
+        # (заголовок по одному биту, далее bits_per_channel бит на значение)
+        if masks.ndim == 0:
+            return count * int(BIT_COUNTS[masks])
+        header = min(count, HEADER_BITS)
+        return header + (count - header) * self.bits_per_channel
 
+    def change_report(self, original_values, new_values, bits_written, positions=None):
+        # Точные метрики искажения по измененным значениям каналов без повторного
+        # чтения изображений: остальные значения не менялись, их вклад в MSE равен 0
+        diff = new_values.astype(np.int32) - original_values
+        squared_error = int(np.dot(diff, diff))
+        bits_flipped = int(BIT_COUNTS[original_values ^ new_values].sum(dtype=np.int64))
+
+        mse = squared_error / (self.height * self.width * 3)
+        psnr = float('inf') if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+        # Область изменений (left, upper, right, lower) в координатах пикселей
+        changed = np.flatnonzero(diff) if positions is None else positions[diff != 0]
+        bbox = None
+        if changed.size:
+            rows = changed // (self.width * 3)
+            columns = changed % (self.width * 3) // 3
+            bbox = (int(columns.min()), int(rows.min()), int(columns.max()) + 1, int(rows.max()) + 1)
+
+        return {
+            'bits_written': bits_written,
+            'bits_flipped': bits_flipped,
+            'MSE': mse,
+            'PSNR': psnr,
+            'bbox': bbox,
+            # Средняя глубина и доля измененных значений для оценки ожидаемого искажения
+            'bits_per_channel': max(1, round(bits_written / new_values.size)) if new_values.size else 1,
+            'used_fraction': new_values.size / (self.height * self.width * 3)
+        }
+
+    def payload_symbols(self, payload):
+        # payload: bytes-подобный объект или str (кодируется в UTF-8)
+        with instrumentation.current().stage('pack') as stage:
+            payload, flags = self.prepare_payload(payload)
+            stage.add(bytes=payload.nbytes)
+
+            capacity = self.stored_capacity()
+            if payload.nbytes > capacity:
+                raise ValueError(
+                    f"Размер сообщения ({payload.nbytes} байт) превышает вместимость "
+                    f"контейнера ({capacity} байт)"
+                )
+
+            # Символы контейнера и маски заменяемых разрядов для каждого значения канала
+            symbols, masks = container_symbols(payload, flags, self.bits_per_channel)
+
+            positions = None
+            if self.key is not None:
+                # Заголовок остается в первых 80 значениях каналов, позиции нагрузки
+                # вычисляются по ключу только для нужного числа символов
+                payload_positions = scatter_positions(
+                    self.key, symbols.size - HEADER_BITS, HEADER_BITS, self.pixels.size)
+                positions = np.concatenate((np.arange(HEADER_BITS), payload_positions))
+        return symbols, masks, positions
+
+    def embed_to_array(self, payload, return_report=False):
+        # При return_report=True возвращает пару (пиксели, отчет о встраивании)
+        symbols, masks, positions = self.payload_symbols(payload)
+        report = {} if return_report else None
         try:
-            message_with_marker = message + '[END]'
+            modified_pixels = self.embed_bits(symbols, report, masks, positions)
 
-            binary_message = self.text_to_binary(message_with_marker)
+        except CancelledError:
+            raise
+        except Exception as e:
+            raise Exception(f"Ошибка при встраивании: {str(e)}")
 
-            pixels_flat = self.pixels.reshape(-1)
+        if return_report:
+            return modified_pixels, report
+        return modified_pixels
 
-            for i, bit in enumerate(binary_message):
-                pixel_value = pixels_flat[i]
+    def embed_to_buffer(self, payload, format='PNG'):
+        # Возвращает закодированное стего-изображение в виде bytes
+        modified_pixels = self.embed_to_array(payload)
+        try:
+            return encode_image(modified_pixels, format)
+        except Exception as e:
+            raise Exception(f"Ошибка при встраивании: {str(e)}")
 
-                masked_value = pixel_value & 0xFE
+    def embed_bytes(self, payload, output_path='stego_image.png', return_report=False):
+        # payload: bytes, bytearray или memoryview с произвольными двоичными данными;
+        # output_path: путь к файлу или файлоподобный объект.
+        # При return_report=True вместо True возвращается отчет о встраивании
+        if self.bmp_layout is not None and is_path(output_path) \
+                and str(output_path).lower().endswith('.bmp'):
+            return self.embed_bmp_in_place(payload, output_path, return_report)
 
-                new_value = masked_value | int(bit)
+        report = None
+        if return_report:
+            modified_pixels, report = self.embed_to_array(payload, return_report=True)
+        else:
+            modified_pixels = self.embed_to_array(payload)
+        try:
+            save_cached(modified_pixels, output_path)
+            return report if return_report else True
+        except Exception as e:
+            raise Exception(f"Ошибка при встраивании: {str(e)}")
 
-                pixels_flat[i] = new_value
+    def embed_bmp_in_place(self, payload, output_path, return_report=False):
+        # Несжатый BMP копируется средствами ОС и изменяется через отображение в память:
+        # декодирование и копирование всего изображения не требуется.
+        # Если output_path совпадает с исходным файлом, он изменяется на месте
+        symbols, masks, positions = self.payload_symbols(payload)
+        report = {} if return_report else None
+        try:
+            if not (os.path.exists(output_path) and os.path.samefile(output_path, self.source_path)):
+                shutil.copyfile(self.source_path, output_path)
 
-            modified_pixels = pixels_flat.reshape(self.pixels.shape)
+            output_pixels = map_bmp_pixels(output_path, self.bmp_layout, mode='r+')
+            self.write_bits(output_pixels, symbols, report, masks, positions)
+            output_pixels.flush()
+            del output_pixels
+            return report if return_report else True
+        except CancelledError:
+            raise
+        except Exception as e:
+            raise Exception(f"Ошибка при встраивании: {str(e)}")
 
-            result_image = Image.fromarray(modified_pixels.astype('uint8'), 'RGB')
+    def embed_data(self, message, output_path='stego_image.png', legacy=False, return_report=False):
+        # legacy=True записывает сообщение в старом формате с маркером [END]
+        if not legacy:
+            # Текст кодируется в UTF-8 один раз и встраивается как байты
+            return self.embed_bytes(message.encode('utf-8'), output_path, return_report)
 
-            result_image.save(output_path, 'PNG')
+        try:
+            data = message.encode('latin-1')
+        except UnicodeEncodeError:
+            raise ValueError("Старый формат поддерживает только символы Latin-1")
+
+        # Старый формат всегда использует один бит на канал
+        capacity = self.stored_capacity(bits_per_channel=1)
+        if len(data) > capacity:
+            raise ValueError(
+                f"Размер сообщения ({len(data)} байт) превышает вместимость "
+                f"контейнера ({capacity} байт)"
+            )
 
-            return True
+        try:
+            bits = bytes_to_bits(data + LEGACY_END_MARKER)
+            report = {} if return_report else None
+            modified_pixels = self.embed_bits(bits, report)
+            save_cached(modified_pixels, output_path)
+            return report if return_report else True
 
         except Exception as e:
             raise Exception(f"Ошибка при встраивании: {str(e)}")
 
-    def get_image_info(self):
-      
-        return {
+    def get_image_info(self, payload=None):
+        # payload: пример нагрузки для оценки эффективной вместимости при сжатии
+        info = {
             'width': self.width,
             'height': self.height,
             'size': f"{self.width}×{self.height}",
+            # Вместимость указана в байтах (для текста UTF-8 символ может занимать до 4 байт)
             'capacity': self.calculate_capacity(),
+            'bits_per_channel': self.bits_per_channel,
             'total_pixels': self.height * self.width,
-            'total_bits': self.height * self.width * 3
+            'total_bits': self.height * self.width * 3 * self.bits_per_channel
         }
+        if payload is not None:
+            info['effective_capacity'] = self.calculate_capacity(payload=payload)
+        return info
 
 
 if __name__ == "__main__":
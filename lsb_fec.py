@@ -0,0 +1,163 @@
+"""
+Помехоустойчивое кодирование нагрузки.
+Данные с префиксом длины разбиваются на блоки с CRC32, затем каждый
+полубайт кодируется кодом Хэмминга (7,4), исправляющим одну ошибку в
+кодовом слове. Кодирование и декодирование выполняются таблицами над
+массивами NumPy для всех блоков сразу.
+Здесь же общая для всех способов встраивания подготовка нагрузки (сжатие,
+затем кодирование) и проверка результата декодирования.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+from lsb_compress import compress_payload
+from lsb_format import FLAG_FEC, codec_flags
+
+
+# Блок: BLOCK_DATA байт данных и 4 байта CRC32
+BLOCK_DATA = 60
+BLOCK_SIZE = BLOCK_DATA + 4
+# Каждый байт кодируется двумя 7-битными словами: 14 бит вместо 8
+ENCODED_BLOCK_SIZE = BLOCK_SIZE * 14 // 8
+
+LENGTH_FORMAT = '>I'
+LENGTH_SIZE = struct.calcsize(LENGTH_FORMAT)
+
+
+def _build_tables():
+    # Кодовое слово (p1 p2 d1 p3 d2 d3 d4) для каждого полубайта и таблица
+    # декодирования для всех 128 принимаемых слов с исправлением одной ошибки
+    encode = np.zeros(16, dtype=np.uint8)
+    for nibble in range(16):
+        d1, d2, d3, d4 = (nibble >> 3) & 1, (nibble >> 2) & 1, (nibble >> 1) & 1, nibble & 1
+        p1, p2, p3 = d1 ^ d2 ^ d4, d1 ^ d3 ^ d4, d2 ^ d3 ^ d4
+        word = 0
+        for bit in (p1, p2, d1, p3, d2, d3, d4):
+            word = (word << 1) | bit
+        encode[nibble] = word
+
+    decode = np.zeros(128, dtype=np.uint8)
+    corrected = np.zeros(128, dtype=bool)
+    for word in range(128):
+        bits = [(word >> (6 - i)) & 1 for i in range(7)]
+        # Синдром равен номеру (с 1) ошибочной позиции
+        syndrome = ((bits[0] ^ bits[2] ^ bits[4] ^ bits[6])
+                    | (bits[1] ^ bits[2] ^ bits[5] ^ bits[6]) << 1
+                    | (bits[3] ^ bits[4] ^ bits[5] ^ bits[6]) << 2)
+        if syndrome:
+            bits[syndrome - 1] ^= 1
+            corrected[word] = True
+        decode[word] = bits[2] << 3 | bits[4] << 2 | bits[5] << 1 | bits[6]
+    return encode, decode, corrected
+
+
+_ENCODE, _DECODE, _CORRECTED = _build_tables()
+
+# Таблицы для целых байтов: байт <-> 14-битное значение из двух кодовых слов
+_BYTES = np.arange(256)
+_ENCODE_BYTE = (_ENCODE[_BYTES >> 4].astype(np.uint64) << np.uint64(7)) | _ENCODE[_BYTES & 0x0F]
+_VALUES = np.arange(1 << 14)
+_DECODE_BYTE = (_DECODE[_VALUES >> 7] << 4) | _DECODE[_VALUES & 0x7F]
+_CORRECTED_BYTE = _CORRECTED[_VALUES >> 7] | _CORRECTED[_VALUES & 0x7F]
+
+# Четыре байта (56 бит кода) упаковываются в 7 байт через 64-битное слово
+_SHIFTS = np.array([42, 28, 14, 0], dtype=np.uint64)
+
+
+def data_capacity(capacity):
+    # Наибольшая длина нагрузки, закодированный размер которой не превышает capacity
+    return max(0, capacity // ENCODED_BLOCK_SIZE * BLOCK_DATA - LENGTH_SIZE)
+
+
+def _block_crcs(data, blocks):
+
+    view = memoryview(data)
+    return [zlib.crc32(view[i * BLOCK_DATA:(i + 1) * BLOCK_DATA]) for i in range(blocks)]
+
+
+def encode_frames(payload):
+
+    payload = memoryview(payload).cast('B')
+    data = struct.pack(LENGTH_FORMAT, payload.nbytes) + payload.tobytes()
+    blocks = max(1, -(-len(data) // BLOCK_DATA))
+    data += bytes(blocks * BLOCK_DATA - len(data))
+
+    framed = np.empty((blocks, BLOCK_SIZE), dtype=np.uint8)
+    framed[:, :BLOCK_DATA] = np.frombuffer(data, dtype=np.uint8).reshape(blocks, BLOCK_DATA)
+    crcs = np.array(_block_crcs(data, blocks), dtype='>u4')
+    framed[:, BLOCK_DATA:] = crcs.view(np.uint8).reshape(blocks, 4)
+
+    # Каждые 4 байта -> 4 x 14 бит кода -> 7 байт
+    values = _ENCODE_BYTE[framed.reshape(-1, 4)] << _SHIFTS
+    packed = np.bitwise_or.reduce(values, axis=1).astype('>u8')
+    return packed.view(np.uint8).reshape(-1, 8)[:, 1:].tobytes()
+
+
+def decode_frames(data):
+    # Возвращает (нагрузка, отчет). Блоки с ошибкой CRC после исправления
+    # считаются неисправимыми, их данные возвращаются как есть
+    blocks = len(data) // ENCODED_BLOCK_SIZE
+    if blocks == 0:
+        raise ValueError("Помехоустойчивые данные обрезаны")
+
+    encoded = np.frombuffer(data, dtype=np.uint8, count=blocks * ENCODED_BLOCK_SIZE)
+    words = np.zeros((encoded.size // 7, 8), dtype=np.uint8)
+    words[:, 1:] = encoded.reshape(-1, 7)
+    values = (words.view('>u8') >> _SHIFTS) & np.uint64(0x3FFF)
+    values = values.reshape(-1).astype(np.intp)
+
+    framed = _DECODE_BYTE[values].reshape(blocks, BLOCK_SIZE)
+    corrected_blocks = _CORRECTED_BYTE[values].reshape(blocks, BLOCK_SIZE).any(axis=1)
+
+    data = framed[:, :BLOCK_DATA].tobytes()
+    crcs = np.array(_block_crcs(data, blocks), dtype=np.uint32)
+    stored = framed[:, BLOCK_DATA:].copy().view('>u4').reshape(-1)
+    failed = crcs != stored
+
+    length = struct.unpack(LENGTH_FORMAT, data[:LENGTH_SIZE])[0]
+    report = {
+        'blocks': blocks,
+        'corrected_blocks': int((corrected_blocks & ~failed).sum()),
+        'uncorrectable_blocks': int(failed.sum())
+    }
+    if length > len(data) - LENGTH_SIZE:
+        # Поврежден префикс длины: возвращаются все данные
+        report['uncorrectable_blocks'] = max(1, report['uncorrectable_blocks'])
+        length = len(data) - LENGTH_SIZE
+    return data[LENGTH_SIZE:LENGTH_SIZE + length], report
+
+
+class UncorrectableError(ValueError):
+    #Нагрузка содержит неисправимые блоки; report — отчет декодирования.
+
+    def __init__(self, report):
+        super().__init__(
+            f"Нагрузка повреждена: неисправимых блоков {report['uncorrectable_blocks']} "
+            f"из {report['blocks']}"
+        )
+        self.report = report
+
+
+def correct_frames(data):
+    # Декодирование с исправлением ошибок: (нагрузка, отчет). При неисправимых
+    # блоках нагрузка не возвращается — возникает UncorrectableError
+    data, report = decode_frames(data)
+    if report['uncorrectable_blocks']:
+        raise UncorrectableError(report)
+    return data, report
+
+
+def encode_payload(payload, compression=None, error_correction=False):
+    # Нагрузка в записываемом виде: сжатие (None, 'zlib', 'bz2', 'lzma' или 'auto'),
+    # затем помехоустойчивое кодирование. Возвращает (данные, флаги заголовка)
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    codec, data = compress_payload(memoryview(payload).cast('B'), compression)
+    flags = codec_flags(codec)
+    if error_correction:
+        data = encode_frames(data)
+        flags |= FLAG_FEC
+    return memoryview(data).cast('B'), flags
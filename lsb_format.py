@@ -0,0 +1,230 @@
+"""
+Формат контейнера LSB Steganography.
+Заголовок записывается в младшие биты первых значений каналов и содержит
+сигнатуру, версию формата, флаги и длину полезной нагрузки в байтах.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+
+# Сигнатура заголовка: непечатаемый первый байт исключает совпадение
+# с началом текстового сообщения старого формата
+MAGIC = b'\x89LSB'
+FORMAT_VERSION = 1
+
+# Сигнатура (4 байта), версия (1), флаги (1), длина нагрузки (4), big-endian
+HEADER_FORMAT = '>4sBBI'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+HEADER_BITS = HEADER_SIZE * 8
+
+# Маркер конца сообщения в старом (текстовом) формате
+LEGACY_END_MARKER = b'[END]'
+
+# Флаги заголовка: биты 0-1 хранят глубину встраивания нагрузки (1-4 бита на канал) минус 1.
+# Сам заголовок всегда записывается по одному биту на канал
+FLAG_DEPTH_MASK = 0x03
+MAX_BITS_PER_CHANNEL = 4
+# Бит 2: нагрузка рассеяна по изображению по секретному ключу
+FLAG_SCATTER = 0x04
+# Биты 3-4: алгоритм сжатия нагрузки (номер в CODEC_NAMES)
+FLAG_CODEC_MASK = 0x18
+FLAG_CODEC_SHIFT = 3
+CODEC_NAMES = ('none', 'zlib', 'bz2', 'lzma')
+# Бит 5: нагрузка закодирована помехоустойчивым кодом (блоки с CRC32, Хэмминг (7,4))
+FLAG_FEC = 0x20
+# Бит 6: изображение содержит одну часть нагрузки, распределенной по нескольким
+# изображениям; нагрузка начинается с заголовка части
+FLAG_SHARD = 0x40
+
+# Бит 7: нагрузка распределена по кадрам многокадрового изображения (страницы TIFF,
+# кадры APNG); записанные данные начинаются с таблицы кадров
+FLAG_MULTIFRAME = 0x80
+
+# Заголовок части: идентификатор нагрузки (8 байт), номер части, число частей,
+# CRC32 данных части, big-endian
+SHARD_HEADER_FORMAT = '>8sIII'
+SHARD_HEADER_SIZE = struct.calcsize(SHARD_HEADER_FORMAT)
+
+# Таблица кадров: число кадров, затем ширина и высота каждого кадра, big-endian
+FRAME_COUNT_FORMAT = '>H'
+FRAME_SIZE_FORMAT = '>II'
+MAX_FRAMES = 0xFFFF
+
+
+def build_header(payload_length, flags=0):
+
+    if not 0 <= payload_length <= 0xFFFFFFFF:
+        raise ValueError(f"Недопустимая длина нагрузки: {payload_length}")
+    return struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, flags, payload_length)
+
+
+def parse_header(data):
+    #Возвращает словарь с полями заголовка или None, если сигнатура не найдена.
+    if len(data) < HEADER_SIZE:
+        return None
+
+    magic, version, flags, length = struct.unpack(HEADER_FORMAT, bytes(data[:HEADER_SIZE]))
+    if magic != MAGIC:
+        return None
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Неподдерживаемая версия формата: {version}")
+
+    return {
+        'version': version,
+        'flags': flags,
+        'length': length,
+        'bits_per_channel': (flags & FLAG_DEPTH_MASK) + 1,
+        'codec': CODEC_NAMES[(flags & FLAG_CODEC_MASK) >> FLAG_CODEC_SHIFT]
+    }
+
+
+def build_shard_header(payload_id, index, count, data):
+
+    return struct.pack(SHARD_HEADER_FORMAT, payload_id, index, count, zlib.crc32(data))
+
+
+def parse_shard_header(data):
+
+    if len(data) < SHARD_HEADER_SIZE:
+        raise ValueError("Заголовок части нагрузки обрезан")
+    payload_id, index, count, crc = struct.unpack(SHARD_HEADER_FORMAT, bytes(data[:SHARD_HEADER_SIZE]))
+    if index >= count:
+        raise ValueError(f"Недопустимый номер части нагрузки: {index} из {count}")
+    return {'id': payload_id, 'index': index, 'count': count, 'crc32': crc}
+
+
+def frame_table_size(count):
+
+    return struct.calcsize(FRAME_COUNT_FORMAT) + count * struct.calcsize(FRAME_SIZE_FORMAT)
+
+
+def build_frame_table(sizes):
+    # sizes: список пар (ширина, высота) в порядке кадров
+    if not 1 <= len(sizes) <= MAX_FRAMES:
+        raise ValueError(f"Недопустимое число кадров: {len(sizes)}")
+    return struct.pack(FRAME_COUNT_FORMAT, len(sizes)) + b''.join(
+        struct.pack(FRAME_SIZE_FORMAT, width, height) for width, height in sizes
+    )
+
+
+def parse_frame_table(data):
+    # Список пар (ширина, высота); ValueError, если таблица обрезана
+    count_size = struct.calcsize(FRAME_COUNT_FORMAT)
+    entry_size = struct.calcsize(FRAME_SIZE_FORMAT)
+    if len(data) < count_size:
+        raise ValueError("Таблица кадров обрезана")
+    count, = struct.unpack(FRAME_COUNT_FORMAT, bytes(data[:count_size]))
+    if count == 0 or len(data) < frame_table_size(count):
+        raise ValueError("Таблица кадров обрезана")
+    return [struct.unpack_from(FRAME_SIZE_FORMAT, bytes(data), count_size + index * entry_size)
+            for index in range(count)]
+
+
+def depth_flags(bits_per_channel):
+
+    if not 1 <= bits_per_channel <= MAX_BITS_PER_CHANNEL:
+        raise ValueError(
+            f"Глубина встраивания должна быть от 1 до {MAX_BITS_PER_CHANNEL} бит на канал"
+        )
+    return bits_per_channel - 1
+
+
+def codec_flags(codec):
+
+    if codec not in CODEC_NAMES:
+        raise ValueError(f"Неизвестный алгоритм сжатия: {codec}")
+    return CODEC_NAMES.index(codec) << FLAG_CODEC_SHIFT
+
+
+def bytes_to_bits(data):
+    # Принимает bytes, bytearray или memoryview без посимвольной обработки
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+
+
+def bits_to_symbols(bits, bits_per_channel=1):
+    # Группировка бит в символы по bits_per_channel бит (старшие биты первыми);
+    # последний символ дополняется нулями
+    if bits_per_channel == 1:
+        return bits
+
+    padding = -bits.size % bits_per_channel
+    if padding:
+        bits = np.concatenate((bits, np.zeros(padding, dtype=np.uint8)))
+    weights = (1 << np.arange(bits_per_channel - 1, -1, -1)).astype(np.uint8)
+    return bits.reshape(-1, bits_per_channel) @ weights
+
+
+def pack_symbols(data, bits_per_channel=1):
+    # Разбиение байтов на символы по bits_per_channel бит
+    return bits_to_symbols(bytes_to_bits(data), bits_per_channel)
+
+
+def symbol_bits(values, bits_per_channel=1):
+    # Поток бит из младших bits_per_channel бит значений каналов
+    if bits_per_channel == 1:
+        return values & 1
+    return np.unpackbits(values[:, None], axis=1)[:, 8 - bits_per_channel:].reshape(-1)
+
+
+def unpack_symbols(values, count, bits_per_channel=1):
+    # Сборка count байт из младших bits_per_channel бит значений каналов
+    return np.packbits(symbol_bits(values, bits_per_channel)[:count * 8]).tobytes()
+
+
+def unpack_block(values, carry, bits_per_channel=1):
+    # Чтение потока символов блоками (полосами, кадрами): байты из младших бит
+    # очередного блока значений каналов. carry — биты предыдущего блока, не
+    # составившие целого байта. Возвращает (байты, новый остаток бит)
+    bits = np.concatenate((carry, symbol_bits(values, bits_per_channel)))
+    whole = bits.size - bits.size % 8
+    return np.packbits(bits[:whole]).tobytes(), bits[whole:]
+
+
+def symbol_count(length, bits_per_channel=1):
+    # Число значений каналов, занимаемых length байтами нагрузки
+    return -(-length * 8 // bits_per_channel)
+
+
+def container_symbols(payload, flags=0, bits_per_channel=1):
+    # Значения для записи в младшие биты: заголовок по одному биту на канал,
+    # затем нагрузка по bits_per_channel бит. Возвращает (символы, маски разрядов)
+    payload = memoryview(payload).cast('B')
+    flags |= depth_flags(bits_per_channel)
+    header_bits = bytes_to_bits(build_header(payload.nbytes, flags))
+    symbols = np.concatenate((header_bits, pack_symbols(payload, bits_per_channel)))
+
+    masks = np.full(symbols.size, (1 << bits_per_channel) - 1, dtype=np.uint8)
+    masks[:HEADER_BITS] = 1
+    return symbols, masks
+
+
+def stream_symbols(stored, header_bits, start, end, bits_per_channel=1):
+    # Символы контейнера с номерами [start, end) для записи блоками (полосами, кадрами):
+    # заголовок по одному биту на канал, затем записанные данные по bits_per_channel бит.
+    # Распаковываются только байты, в которые попадают эти символы. Возвращает (символы, маски)
+    header = header_bits[start:min(end, HEADER_BITS)]
+    first = max(start, HEADER_BITS) - HEADER_BITS
+    last = end - HEADER_BITS
+    symbols = header
+    if last > first:
+        first_bit, last_bit = first * bits_per_channel, last * bits_per_channel
+        bits = bytes_to_bits(stored[first_bit // 8:-(-last_bit // 8)])
+        bits = bits[first_bit % 8:first_bit % 8 + last_bit - first_bit]
+        symbols = np.concatenate((header, bits_to_symbols(bits, bits_per_channel)))
+
+    masks = np.full(symbols.size, (1 << bits_per_channel) - 1, dtype=np.uint8)
+    masks[:header.size] = 1
+    return symbols, masks
+
+
+def set_lsb(values, symbols, masks=np.uint8(1)):
+    # Запись символов в младшие разряды значений каналов (массив изменяется на месте)
+    values[...] = (values & ~masks) | symbols
+
+
+def capacity_bytes(channel_count, bits_per_channel=1):
+    # Вместимость в байтах нагрузки для заданного числа значений каналов
+    return max(0, (channel_count - HEADER_BITS) * bits_per_channel // 8)
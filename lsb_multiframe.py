@@ -0,0 +1,281 @@
+"""
+Встраивание нагрузки в многокадровые изображения: страницы TIFF, кадры APNG и GIF.
+Значения каналов всех кадров образуют одно пространство в порядке кадров:
+заголовок контейнера занимает первые значения первого кадра, за ним следуют
+таблица кадров (размеры каждого кадра) и нагрузка. Кадры читаются, изменяются
+и записываются по одному, поэтому в памяти находится только один кадр;
+при извлечении декодируются только кадры, содержащие нагрузку.
+GIF хранит цвета в палитре и не сохраняет младшие биты, поэтому кадры GIF
+записываются в APNG или TIFF.
+"""
+
+import os
+from contextlib import ExitStack, contextmanager
+
+import numpy as np
+
+import instrumentation
+from image_io import array_to_image, array_to_rgb, is_path, open_image
+from lsb_fec import encode_payload
+from lsb_format import (FLAG_MULTIFRAME, HEADER_BITS, build_frame_table, build_header,
+                        bytes_to_bits, capacity_bytes, depth_flags, frame_table_size,
+                        parse_frame_table, set_lsb, stream_symbols, symbol_count, unpack_block)
+from lsb_progress import CancelledError, report_progress
+from png_stream import APNGWriter
+
+
+# Формат записи по расширению выходного файла
+OUTPUT_FORMATS = {'.tif': 'TIFF', '.tiff': 'TIFF', '.png': 'PNG', '.apng': 'PNG'}
+# Длительность кадра APNG (мс), если источник ее не задает
+DEFAULT_DURATION = 100
+
+
+@contextmanager
+def _opened(source):
+    # Открытое изображение источника; закрывается по выходе, если его открыли здесь.
+    # Файловый объект мог быть прочитан раньше (например, при загрузке первого кадра)
+    if hasattr(source, 'seek') and hasattr(source, 'read'):
+        source.seek(0)
+    image = open_image(source)
+    try:
+        yield image
+    finally:
+        if image is not source:
+            image.close()
+
+
+def frame_sizes(image):
+    # Размеры кадров (ширина, высота) без декодирования пикселей: страницы TIFF
+    # могут различаться, кадры анимации отображаются на холст размера изображения
+    count = getattr(image, 'n_frames', 1)
+    if image.format != 'TIFF':
+        return [image.size] * count
+
+    sizes = []
+    for index in range(count):
+        image.seek(index)
+        sizes.append(image.size)
+    image.seek(0)
+    return sizes
+
+
+def source_frame_sizes(source):
+    # Массив NumPy — всегда один кадр
+    if isinstance(source, np.ndarray):
+        return [(source.shape[1], source.shape[0])]
+    with _opened(source) as image:
+        return frame_sizes(image)
+
+
+def frames_capacity(sizes, bits_per_channel=1):
+    # Вместимость всех кадров в байтах нагрузки за вычетом таблицы кадров
+    channels = sum(width * height * 3 for width, height in sizes)
+    return max(0, capacity_bytes(channels, bits_per_channel) - frame_table_size(len(sizes)))
+
+
+def frame_pixels(image, index):
+    # Пиксели одного кадра в RGB, формы (H, W, 3)
+    with instrumentation.current().stage('decode') as stage:
+        image.seek(index)
+        pixels = np.array(image.convert('RGB'))
+        stage.add(pixels=pixels.shape[0] * pixels.shape[1])
+    return pixels
+
+
+class _TIFFFrameWriter:
+    # Страницы TIFF дописываются в файл по одной
+
+    def __init__(self, output):
+        from PIL import TiffImagePlugin
+
+        self.file = TiffImagePlugin.AppendingTiffWriter(output, new=True)
+
+    def write(self, pixels, duration):
+
+        array_to_image(pixels).save(self.file, format='TIFF')
+        self.file.newFrame()
+
+    def close(self):
+
+        self.file.close()
+
+    def abort(self):
+
+        self.file.close()
+
+
+class _APNGFrameWriter:
+    # Кадры APNG записываются полосами строк через APNGWriter
+
+    def __init__(self, output, size, count):
+        self.writer = APNGWriter(output, size[0], size[1], count)
+
+    def write(self, pixels, duration):
+
+        self.writer.begin_frame(duration)
+        self.writer.write_rows(pixels)
+
+    def close(self):
+
+        self.writer.close()
+
+    def abort(self):
+
+        self.writer.abort()
+
+
+def _output_format(output, format):
+
+    if format is None:
+        if not is_path(output):
+            raise ValueError("Для файлового объекта требуется явный формат записи")
+        extension = os.path.splitext(os.fspath(output))[1].lower()
+        if extension == '.gif':
+            raise ValueError("GIF не сохраняет младшие биты цветов: выберите формат APNG или TIFF")
+        format = OUTPUT_FORMATS.get(extension)
+        if format is None:
+            raise ValueError(f"Неподдерживаемый формат многокадрового изображения: {extension}")
+    format = format.upper()
+    if format not in ('TIFF', 'PNG'):
+        raise ValueError(f"Неподдерживаемый формат многокадрового изображения: {format}")
+    return format
+
+
+def embed_frames(source, payload, output, bits_per_channel=1, compression=None,
+                 error_correction=False, format=None, progress=None):
+    # source: многокадровое изображение (путь, bytes, файловый объект или изображение PIL);
+    # output: путь или файловый объект; format: 'TIFF' или 'PNG' (APNG), по умолчанию
+    # определяется по расширению пути; progress: progress(done, total) по кадрам.
+    # Возвращает отчет: число кадров, кадров с нагрузкой, записанных байт и вместимость
+    try:
+        format = _output_format(output, format)
+        with _opened(source) as image:
+            return _embed_frames(image, payload, output, bits_per_channel, compression,
+                                 error_correction, format, progress)
+
+    except CancelledError:
+        raise
+    except Exception as e:
+        raise Exception(f"Ошибка при встраивании в кадры: {str(e)}")
+
+
+def _embed_frames(image, payload, output, bits_per_channel, compression, error_correction,
+                  format, progress):
+
+    sizes = frame_sizes(image)
+    if format == 'PNG' and len(set(sizes)) > 1:
+        raise ValueError("Кадры APNG должны быть одного размера: выберите формат TIFF")
+
+    data, flags = encode_payload(payload, compression, error_correction)
+    flags |= FLAG_MULTIFRAME | depth_flags(bits_per_channel)
+
+    capacity = frames_capacity(sizes, bits_per_channel)
+    if len(data) > capacity:
+        raise ValueError(
+            f"Размер нагрузки ({len(data)} байт) превышает вместимость кадров ({capacity} байт)"
+        )
+    table = build_frame_table(sizes)
+    width, height = sizes[0]
+    if HEADER_BITS + symbol_count(len(table), bits_per_channel) > width * height * 3:
+        raise ValueError("Первый кадр слишком мал для заголовка и таблицы кадров")
+
+    # Таблица кадров записывается перед нагрузкой: декодер узнает из нее,
+    # в каких кадрах лежат данные, прочитав только первый кадр
+    stored = table + bytes(data)
+    header_bits = bytes_to_bits(build_header(len(stored), flags))
+    total = HEADER_BITS + symbol_count(len(stored), bits_per_channel)
+
+    if format == 'TIFF':
+        writer = _TIFFFrameWriter(output)
+    else:
+        writer = _APNGFrameWriter(output, sizes[0], len(sizes))
+
+    try:
+        position = 0
+        used_frames = 0
+        for index in range(len(sizes)):
+            pixels = frame_pixels(image, index)
+            values = pixels.reshape(-1)
+            end = min(total, position + values.size)
+            if end > position:
+                with instrumentation.current().stage('embed', values=end - position):
+                    symbols, masks = stream_symbols(stored, header_bits, position, end,
+                                                    bits_per_channel)
+                    set_lsb(values[:end - position], symbols, masks)
+                used_frames += 1
+            position += values.size
+
+            with instrumentation.current().stage('encode'):
+                writer.write(pixels, image.info.get('duration', DEFAULT_DURATION))
+            report_progress(progress, index + 1, len(sizes))
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+    return {
+        'frames': len(sizes),
+        'used_frames': used_frames,
+        'stored_bytes': len(stored),
+        'capacity': capacity,
+        'format': format
+    }
+
+
+def read_frames(source, header, first_pixels=None, progress=None):
+    # Записанные байты нагрузки (после таблицы кадров) многокадрового контейнера.
+    # first_pixels: уже загруженный первый кадр. Остальные кадры декодируются,
+    # только пока не прочитаны все символы нагрузки; источник открывается
+    # только для них. Массив NumPy — один кадр: из него читается нагрузка,
+    # целиком лежащая в первом кадре
+    if isinstance(source, np.ndarray) and first_pixels is None:
+        first_pixels = array_to_rgb(source)
+    with ExitStack() as stack:
+        image = None
+        if first_pixels is None:
+            image = stack.enter_context(_opened(source))
+            first_pixels = frame_pixels(image, 0)
+        bits_per_channel = header['bits_per_channel']
+        total = HEADER_BITS + symbol_count(header['length'], bits_per_channel)
+
+        chunks = []
+        carry = np.zeros(0, dtype=np.uint8)
+        sizes = None
+        position = 0
+        index = 0
+        while position < total:
+            if index == 0:
+                pixels = first_pixels
+            else:
+                if sizes is None or index >= len(sizes):
+                    raise ValueError("Длина нагрузки превышает вместимость кадров")
+                if isinstance(source, np.ndarray):
+                    raise ValueError("Массив NumPy содержит только первый кадр, а нагрузка "
+                                     "продолжается в следующих кадрах: передайте файл изображения")
+                if image is None:
+                    image = stack.enter_context(_opened(source))
+                pixels = frame_pixels(image, index)
+                if (pixels.shape[1], pixels.shape[0]) != sizes[index]:
+                    raise ValueError(f"Размер кадра {index + 1} не совпадает с таблицей кадров")
+
+            values = pixels.reshape(-1)
+            start = max(position, HEADER_BITS)
+            end = min(total, position + values.size)
+            if end > start:
+                # Биты, не составляющие целого байта, переносятся в следующий кадр
+                data, carry = unpack_block(values[start - position:end - position], carry,
+                                           bits_per_channel)
+                chunks.append(data)
+
+            if sizes is None:
+                # Таблица кадров целиком лежит в первом кадре
+                sizes = parse_frame_table(b''.join(chunks))
+                if sizes[0] != (pixels.shape[1], pixels.shape[0]):
+                    raise ValueError("Размер первого кадра не совпадает с таблицей кадров")
+
+            position += values.size
+            index += 1
+            report_progress(progress, min(position, total), total)
+
+    stored = b''.join(chunks)[:header['length']]
+    return stored[frame_table_size(len(sizes)):]
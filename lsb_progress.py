@@ -0,0 +1,39 @@
+"""
+Ход выполнения и отмена длительных операций встраивания и извлечения.
+Кодер и декодер вызывают обработчик progress(done, total) после каждой
+порции данных; обработчик может прервать операцию исключением CancelledError.
+"""
+
+import threading
+
+
+class CancelledError(Exception):
+    #Операция прервана через обработчик хода выполнения.
+    pass
+
+
+class CancelToken:
+    #Флаг отмены, который устанавливается из одного потока и проверяется в другом.
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+
+        self._event.set()
+
+    @property
+    def cancelled(self):
+
+        return self._event.is_set()
+
+    def check(self):
+
+        if self._event.is_set():
+            raise CancelledError("Операция отменена")
+
+
+def report_progress(progress, done, total):
+    # Вызов обработчика, если он задан
+    if progress is not None:
+        progress(done, total)
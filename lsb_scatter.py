@@ -0,0 +1,88 @@
+"""
+Псевдослучайное рассеивание нагрузки по изображению по секретному ключу.
+Пространство значений каналов делится на столько равных интервалов, сколько
+символов в нагрузке; символ с номером i записывается в i-й интервал, в позицию,
+заданную ключевым хэшем номера. Нагрузка равномерно покрывает все изображение,
+позиции любой порции символов вычисляются независимо за O(1) на символ
+и возрастают, поэтому чтение и запись пикселей идут по памяти подряд.
+"""
+
+import hashlib
+
+import numpy as np
+
+
+HASH_ROUNDS = 2
+
+# Позиции вычисляются порциями: временные массивы остаются в кэше процессора
+CHUNK_SIZE = 1 << 16
+
+# Константы перемешивания: lowbias32 для 32-битных индексов, splitmix64 для больших
+_MIX32 = (np.uint32(0x7FEB352D), np.uint32(0x846CA68B), (16, 15, 16))
+_MIX64 = (np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB), (30, 27, 31))
+
+
+def round_keys(key):
+    # Ключ (str, bytes или int) -> ключи раундов хэша
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    elif isinstance(key, int):
+        key = key.to_bytes((key.bit_length() + 8) // 8, 'big', signed=True)
+    digest = hashlib.sha256(bytes(key)).digest()
+    return [int.from_bytes(digest[i * 8:(i + 1) * 8], 'big') for i in range(HASH_ROUNDS)]
+
+
+def _mix(values, round_key, out, scratch, constants):
+    # Перемешивающая функция раунда, все операции на месте в out;
+    # scratch — буфер для сдвигов того же размера, чтобы не выделять память
+    mul1, mul2, (s1, s2, s3) = constants
+    dtype = out.dtype.type
+    np.bitwise_xor(values, round_key, out=out)
+    out ^= np.right_shift(out, dtype(s1), out=scratch)
+    out *= mul1
+    out ^= np.right_shift(out, dtype(s2), out=scratch)
+    out *= mul2
+    out ^= np.right_shift(out, dtype(s3), out=scratch)
+    return out
+
+
+def scatter_positions(key, count, offset, total, start=0, length=None):
+    # Позиции символов нагрузки с номерами [start, start + count) из length символов
+    # (по умолчанию start + count) среди значений каналов [offset, total);
+    # start позволяет читать нагрузку порциями. Позиции возрастают
+    domain = total - offset
+    if length is None:
+        length = start + count
+    if start + count > length or length > domain:
+        raise ValueError("Данные не помещаются в изображение")
+
+    # Начало интервала i — (i * step) >> shift, где step — длина интервала
+    # domain / length в фиксированной точке: деление не требуется, а произведение
+    # не превышает domain << shift и помещается в int64. Длина интервала не меньше 1
+    shift = 63 - domain.bit_length()
+    step = (domain << shift) // length if length else 0
+    # 32-битная арифметика вдвое быстрее, если номера и интервалы в нее помещаются
+    dtype = np.uint32 if domain < 1 << 32 else np.uint64
+    constants = _MIX32 if dtype is np.uint32 else _MIX64
+    mask = (1 << (32 if dtype is np.uint32 else 64)) - 1
+    keys = [dtype(round_key & mask) for round_key in round_keys(key)]
+
+    positions = np.empty(count, dtype=np.int64)
+    for first in range(start, start + count, CHUNK_SIZE):
+        last = min(first + CHUNK_SIZE, start + count)
+        bounds = np.arange(first, last + 1, dtype=np.int64)
+        bounds *= step
+        bounds >>= shift
+        widths = np.diff(bounds).astype(dtype)
+
+        # Ключевой хэш номера символа выбирает позицию внутри интервала
+        digest = np.arange(first, last, dtype=dtype)
+        scratch = np.empty_like(digest)
+        for round_key in keys:
+            _mix(digest, round_key, digest, scratch, constants)
+        digest %= widths
+
+        chunk = positions[first - start:last - start]
+        np.add(bounds[:-1], digest, out=chunk, casting='unsafe')
+    positions += offset
+    return positions
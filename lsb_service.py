@@ -0,0 +1,457 @@
+"""
+HTTP-сервис встраивания и извлечения на asyncio (только стандартная библиотека).
+Декодирование изображений и встраивание выполняются пулом процессов;
+число запросов, принятых к обработке (с момента чтения тела), ограничено,
+при переполнении очереди сервис отвечает 503. Тела запросов читаются
+порциями, ответы передаются порциями (Transfer-Encoding: chunked).
+Ошибки во входных данных возвращаются с кодом 400, внутренние ошибки — с кодом 500.
+Ключ рассеивания передается в заголовке X-Key, чтобы он не попадал в журналы
+запросов вместе со строкой URL.
+
+Конечные точки:
+    POST /embed    тело: нагрузка (X-Payload-Length байт), затем изображение;
+                   параметры: bits_per_channel, compression, error_correction; заголовок X-Key
+    POST /extract  тело: стего-изображение; заголовок X-Key
+    POST /probe    тело: изображение; сведения о размерах и заголовке нагрузки
+    POST /metrics  тело: исходное изображение (X-Original-Length байт), затем стего
+    GET  /stats    число запросов и гистограммы задержек по конечным точкам
+
+Пример:
+    python lsb_service.py --port 8080 --workers 4
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import lzma
+import math
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from image_cache import get_cache
+from image_io import encode_image
+from lsb_decoder import LSBDecoder
+from lsb_encoder import LSBEncoder
+from metrics import ImageQualityMetrics
+
+
+# Ограничения размеров заголовков и тела запроса
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 256 * 1024 * 1024
+# Предельный размер извлеченной (распакованной) нагрузки в ответе /extract
+MAX_PAYLOAD_SIZE = 256 * 1024 * 1024
+# Размер порции при чтении тела запроса и записи ответа
+IO_CHUNK_SIZE = 64 * 1024
+
+# Верхние границы интервалов гистограммы задержек (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+HTTP_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error',
+    503: 'Service Unavailable'
+}
+
+
+class HTTPError(Exception):
+    #Ошибка запроса с кодом ответа HTTP.
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class InputError(Exception):
+    #Задача отклонена из-за некорректных входных данных (ответ 400).
+    pass
+
+
+# Исключения кодера и декодера, вызванные содержимым запроса: неверный формат
+# изображения, параметры, поврежденные или слишком большие данные нагрузки
+INPUT_ERRORS = (ValueError, TypeError, OSError, EOFError, zlib.error, lzma.LZMAError)
+
+
+class LatencyHistogram:
+    #Накопительная гистограмма задержек с фиксированными границами интервалов.
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+
+    def observe(self, seconds, error=False):
+
+        self.count += 1
+        self.errors += error
+        self.total += seconds
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[index] += 1
+                break
+
+    def to_dict(self):
+        # Число запросов с задержкой не больше границы (накопительно)
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets['+Inf' if math.isinf(bound) else str(bound)] = cumulative
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'mean_seconds': self.total / self.count if self.count else 0.0,
+            'buckets': buckets
+        }
+
+
+def _init_worker():
+    # Изображения запросов приходят телами и почти не повторяются:
+    # кэш пикселей в процессах пула только удерживал бы память
+    get_cache().resize(0)
+
+
+def _input_errors(function):
+    # Кодер и декодер оборачивают исключения в Exception с сообщением; по исходному
+    # исключению в цепочке ошибка входных данных отличается от внутренней.
+    # Проверка выполняется в процессе пула, где цепочка исключений еще доступна
+    @functools.wraps(function)
+    def wrapper(*args):
+        try:
+            return function(*args)
+        except Exception as e:
+            cause = e
+            while cause is not None:
+                if isinstance(cause, INPUT_ERRORS):
+                    raise InputError(str(e)) from None
+                cause = cause.__cause__ or cause.__context__
+            raise
+    return wrapper
+
+
+# Задачи пула процессов: получают и возвращают только bytes и простые типы.
+# Тело запроса передается целиком и делится на части уже в процессе пула
+
+@_input_errors
+def _embed_job(body, payload_length, options):
+
+    body = memoryview(body)
+    encoder = LSBEncoder(body[payload_length:], **options)
+    stego_pixels, report = encoder.embed_to_array(body[:payload_length], return_report=True)
+    return encode_image(stego_pixels), report
+
+
+@_input_errors
+def _extract_job(image, key, max_size):
+
+    return LSBDecoder(image, key, max_size=max_size).extract_bytes()
+
+
+@_input_errors
+def _probe_job(image):
+
+    return LSBDecoder.probe(image)
+
+
+@_input_errors
+def _metrics_job(body, original_length):
+
+    body = memoryview(body)
+    return ImageQualityMetrics.get_full_report(body[:original_length], body[original_length:])
+
+
+def _flag(value):
+
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+class LSBService:
+
+    def __init__(self, host='127.0.0.1', port=8080, workers=None, executor=None,
+                 max_pending=None, max_body_size=MAX_BODY_SIZE, max_payload_size=MAX_PAYLOAD_SIZE):
+        # executor: внешний пул (например, для тестов); иначе создается пул процессов.
+        # max_pending: сколько запросов может читаться и ожидать пул, прежде чем
+        # сервис ответит 503; max_payload_size: предел распакованной нагрузки /extract
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self._own_executor = executor is None
+        self.executor = executor or ProcessPoolExecutor(max_workers=self.workers,
+                                                         initializer=_init_worker)
+        self.max_pending = max_pending or self.workers * 4
+        self.max_body_size = max_body_size
+        self.max_payload_size = max_payload_size
+
+        self.pending = 0
+        self._slots = None
+        self._server = None
+        self.routes = {
+            ('POST', '/embed'): self.handle_embed,
+            ('POST', '/extract'): self.handle_extract,
+            ('POST', '/probe'): self.handle_probe,
+            ('POST', '/metrics'): self.handle_metrics,
+            ('GET', '/stats'): self.handle_stats,
+        }
+        self.histograms = {path: LatencyHistogram() for _, path in self.routes}
+
+    async def start(self):
+
+        # Не больше workers задач одновременно передается в пул
+        self._slots = asyncio.Semaphore(self.workers)
+        self._server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, limit=MAX_HEADER_SIZE)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    async def serve_forever(self):
+
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
+
+    def reserve(self):
+        # Обратное давление: место в очереди занимается до чтения тела запроса,
+        # поэтому в памяти одновременно находится не больше max_pending тел;
+        # при переполнении запрос отклоняется сразу
+        if self.pending >= self.max_pending:
+            raise HTTPError(503, "Сервис перегружен, повторите запрос позже")
+        self.pending += 1
+
+    async def run_job(self, function, *args):
+
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, function, *args)
+
+    async def handle_connection(self, reader, writer):
+
+        start = time.perf_counter()
+        path = None
+        status = 500
+        reserved = False
+        try:
+            try:
+                method, path, query, headers = await self.read_request_head(reader)
+                handler = self.routes.get((method, path))
+                if handler is None:
+                    if any(route_path == path for _, route_path in self.routes):
+                        raise HTTPError(405, f"Метод {method} не поддерживается")
+                    raise HTTPError(404, f"Неизвестный путь: {path}")
+                body = b''
+                if method == 'POST':
+                    # Тело не читается, если задачу все равно некуда поставить
+                    self.reserve()
+                    reserved = True
+                    body = await self.read_body(reader, headers)
+                status, content_type, data, extra = await handler(query, headers, body)
+            except HTTPError as e:
+                status, content_type, data, extra = self.error_response(e.status, str(e))
+            except InputError as e:
+                status, content_type, data, extra = self.error_response(400, str(e))
+            except Exception:
+                # Подробности внутренних ошибок клиенту не передаются
+                status, content_type, data, extra = self.error_response(
+                    500, "Внутренняя ошибка сервера")
+            await self.write_response(writer, status, content_type, data, extra)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if reserved:
+                self.pending -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            if path in self.histograms:
+                self.histograms[path].observe(time.perf_counter() - start, status >= 400)
+
+    async def read_request_head(self, reader):
+
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise HTTPError(413, "Слишком большие заголовки запроса")
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, "Некорректная строка запроса")
+
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        return method.upper(), url.path, query, headers
+
+    async def read_body(self, reader, headers):
+        # Тело читается порциями с проверкой предельного размера
+        body = bytearray()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readuntil(b'\r\n')
+                    return body
+                if len(body) + size > self.max_body_size:
+                    raise HTTPError(413, "Слишком большое тело запроса")
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+
+        if 'content-length' not in headers:
+            raise HTTPError(411, "Требуется заголовок Content-Length")
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            raise HTTPError(400, "Некорректный заголовок Content-Length")
+        if not 0 <= length <= self.max_body_size:
+            raise HTTPError(413, "Слишком большое тело запроса")
+        # Тело передается в задачу без копирования в bytes
+        body = bytearray(length)
+        view = memoryview(body)
+        position = 0
+        while position < length:
+            chunk = await reader.read(min(length - position, IO_CHUNK_SIZE))
+            if not chunk:
+                raise HTTPError(400, "Тело запроса обрезано")
+            view[position:position + len(chunk)] = chunk
+            position += len(chunk)
+        return body
+
+    async def write_response(self, writer, status, content_type, data, extra=None):
+        # Тело ответа передается порциями с ожиданием освобождения буфера сокета
+        head = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+                f"Content-Type: {content_type}",
+                "Transfer-Encoding: chunked",
+                "Connection: close"]
+        for name, value in (extra or {}).items():
+            head.append(f"{name}: {value}")
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+
+        view = memoryview(data)
+        for start in range(0, len(view), IO_CHUNK_SIZE):
+            chunk = view[start:start + IO_CHUNK_SIZE]
+            writer.write(f"{len(chunk):x}\r\n".encode('ascii'))
+            writer.write(chunk)
+            writer.write(b'\r\n')
+            await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    def json_response(self, value, status=200):
+
+        data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        return status, 'application/json; charset=utf-8', data, None
+
+    def error_response(self, status, message):
+
+        status, content_type, data, _ = self.json_response({'error': message}, status)
+        extra = {'Retry-After': 1} if status == 503 else None
+        return status, content_type, data, extra
+
+    @staticmethod
+    def part_length(body, headers, header_name):
+        # Тело из двух частей: длина первой из заголовка header_name
+        try:
+            length = int(headers[header_name])
+        except (KeyError, ValueError):
+            raise HTTPError(400, f"Требуется заголовок {header_name}")
+        if not 0 <= length <= len(body):
+            raise HTTPError(400, f"Недопустимое значение {header_name}")
+        return length
+
+    async def handle_embed(self, query, headers, body):
+
+        payload_length = self.part_length(body, headers, 'x-payload-length')
+        try:
+            options = {
+                'bits_per_channel': int(query.get('bits_per_channel', 1)),
+                'key': headers.get('x-key'),
+                'compression': query.get('compression'),
+                'error_correction': _flag(query.get('error_correction', '0'))
+            }
+        except ValueError:
+            raise HTTPError(400, "Некорректный параметр bits_per_channel")
+
+        stego, report = await self.run_job(_embed_job, body, payload_length, options)
+        extra = {
+            'X-Bits-Flipped': report['bits_flipped'],
+            'X-MSE': report['MSE'],
+            'X-PSNR': report['PSNR']
+        }
+        return 200, 'image/png', stego, extra
+
+    async def handle_extract(self, query, headers, body):
+
+        payload = await self.run_job(_extract_job, body, headers.get('x-key'),
+                                     self.max_payload_size)
+        return 200, 'application/octet-stream', payload, None
+
+    async def handle_probe(self, query, headers, body):
+
+        return self.json_response(await self.run_job(_probe_job, body))
+
+    async def handle_metrics(self, query, headers, body):
+
+        original_length = self.part_length(body, headers, 'x-original-length')
+        return self.json_response(await self.run_job(_metrics_job, body, original_length))
+
+    async def handle_stats(self, query, headers, body):
+
+        return self.json_response({
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'workers': self.workers,
+            'endpoints': {path: histogram.to_dict() for path, histogram in self.histograms.items()}
+        })
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="HTTP-сервис LSB-стеганографии")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="число процессов (по умолчанию по числу ядер)")
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help="число ожидающих задач, после которого сервис отвечает 503")
+    args = parser.parse_args(argv)
+
+    service = LSBService(args.host, args.port, args.workers, max_pending=args.max_pending)
+
+    async def run():
+        await service.start()
+        print(f"Сервис запущен на http://{service.host}:{service.port}")
+        try:
+            await service.serve_forever()
+        finally:
+            await service.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,126 @@
+"""
+Распределение большой нагрузки по упорядоченному набору изображений-контейнеров.
+Каждая часть начинается с заголовка (идентификатор нагрузки, номер части,
+число частей, CRC32), поэтому при извлечении части собираются в любом порядке.
+Встраивание и извлечение частей выполняются пулом процессов.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from image_io import open_image
+from lsb_compress import decompress_chunks
+from lsb_decoder import LSBDecoder
+from lsb_encoder import LSBEncoder
+from lsb_fec import correct_frames, encode_payload
+from lsb_format import FLAG_SHARD, SHARD_HEADER_SIZE, build_shard_header, capacity_bytes, depth_flags
+
+
+def container_capacity(path, bits_per_channel=1):
+    # Вместимость по размерам из заголовка файла, без декодирования пикселей
+    with open_image(path) as image:
+        width, height = image.size
+    return capacity_bytes(width * height * 3, bits_per_channel)
+
+
+def split_payload(payload, capacities):
+    # Разбиение данных на части по вместимости контейнеров (за вычетом заголовка части);
+    # используются только первые контейнеры, которых достаточно для всей нагрузки
+    payload = memoryview(payload).cast('B')
+    pieces = []
+    position = 0
+    for capacity in capacities:
+        if position >= payload.nbytes and pieces:
+            break
+        size = max(0, capacity - SHARD_HEADER_SIZE)
+        pieces.append(payload[position:position + size])
+        position += size
+
+    if position < payload.nbytes:
+        total = sum(max(0, capacity - SHARD_HEADER_SIZE) for capacity in capacities)
+        raise ValueError(
+            f"Размер нагрузки ({payload.nbytes} байт) превышает суммарную вместимость "
+            f"контейнеров ({total} байт)"
+        )
+    return pieces
+
+
+def _embed_shard(task):
+
+    source, output_path, shard, flags, bits_per_channel, key = task
+    encoder = LSBEncoder(source, bits_per_channel, key)
+    encoder.header_flags = flags
+    report = encoder.embed_bytes(shard, output_path, return_report=True)
+    report['output'] = output_path
+    return report
+
+
+def embed_shards(payload, sources, output_paths, bits_per_channel=1, key=None,
+                 compression=None, workers=None, error_correction=False):
+    # sources и output_paths: упорядоченные списки путей. Возвращает отчеты о
+    # встраивании для использованных контейнеров (в порядке частей)
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    if len(sources) != len(output_paths):
+        raise ValueError("Число контейнеров и выходных файлов не совпадает")
+    depth_flags(bits_per_channel)
+
+    # Нагрузка сжимается целиком до разбиения, каждая часть хранит кусок сжатого потока
+    data, flags = encode_payload(payload, compression, error_correction)
+    flags |= FLAG_SHARD
+    payload_id = hashlib.blake2b(payload, digest_size=8).digest()
+
+    capacities = [container_capacity(source, bits_per_channel) for source in sources]
+    pieces = split_payload(data, capacities)
+    tasks = []
+    for index, piece in enumerate(pieces):
+        shard = build_shard_header(payload_id, index, len(pieces), piece) + piece
+        tasks.append((sources[index], output_paths[index], shard, flags, bits_per_channel, key))
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(_embed_shard, tasks))
+    except Exception as e:
+        raise Exception(f"Ошибка при встраивании частей: {str(e)}")
+
+
+def _extract_shard(task):
+
+    path, key = task
+    try:
+        info, data = LSBDecoder(path, key).read_shard()
+        return path, info, data, None
+    except Exception as e:
+        return path, None, None, str(e)
+
+
+def extract_shards(paths, key=None, workers=None):
+    # Сборка нагрузки из изображений с частями в любом порядке. Изображения без
+    # частей пропускаются; при нехватке частей возникает ValueError
+    tasks = [(path, key) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_extract_shard, tasks))
+
+    shards = {}
+    payload_id = codec = count = error_correction = None
+    for path, info, data, error in results:
+        if info is None:
+            continue
+        if payload_id is None:
+            payload_id, codec, count = info['id'], info['codec'], info['count']
+            error_correction = info['error_correction']
+        elif info['id'] != payload_id:
+            raise ValueError(f"Изображение {os.path.basename(path)} содержит часть другой нагрузки")
+        shards[info['index']] = data
+
+    if payload_id is None:
+        raise ValueError("Части распределенной нагрузки не найдены")
+    missing = [index + 1 for index in range(count) if index not in shards]
+    if missing:
+        raise ValueError(f"Не найдены части нагрузки: {missing} из {count}")
+
+    data = b''.join(shards[index] for index in range(count))
+    if error_correction:
+        data = correct_frames(data)[0]
+    return b''.join(decompress_chunks([data], codec))
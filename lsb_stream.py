@@ -0,0 +1,154 @@
+"""
+Потоковое встраивание и извлечение для очень больших PNG-контейнеров.
+Изображение обрабатывается горизонтальными полосами: декодируются только
+строки, в которые попадает нагрузка, остальные строки копируются в выходной
+файл без декодирования. Символы нагрузки формируются для каждой полосы
+отдельно, а извлеченные байты распаковываются по мере чтения полос, поэтому
+пиковая память ограничена размером полосы (и самой нагрузкой).
+"""
+
+import numpy as np
+
+from lsb_compress import decompress_chunks
+from lsb_fec import correct_frames, encode_payload
+from lsb_format import (FLAG_FEC, FLAG_MULTIFRAME, FLAG_SCATTER, FLAG_SHARD, HEADER_BITS,
+                        HEADER_SIZE, LEGACY_END_MARKER, build_header, bytes_to_bits,
+                        capacity_bytes, depth_flags, parse_header, set_lsb, stream_symbols,
+                        symbol_count, unpack_block, unpack_symbols)
+from png_stream import PNGStripReader, PNGStripWriter
+
+
+DEFAULT_STRIP_ROWS = 256
+
+
+def embed_stream(source, payload, output, strip_rows=DEFAULT_STRIP_ROWS, compress_level=6,
+                 bits_per_channel=1, compression=None, error_correction=False):
+    # source и output: пути к PNG или файлоподобные объекты;
+    # compression и error_correction: как в LSBEncoder
+    payload, flags = encode_payload(payload, compression, error_correction)
+    flags |= depth_flags(bits_per_channel)
+
+    with PNGStripReader(source, strip_rows) as reader:
+        row_size = reader.width * 3
+        capacity = capacity_bytes(reader.width * reader.height * 3, bits_per_channel)
+        payload_size = payload.nbytes
+        if payload_size > capacity:
+            raise ValueError(
+                f"Размер сообщения ({payload_size} байт) превышает вместимость "
+                f"контейнера ({capacity} байт)"
+            )
+
+        header_bits = bytes_to_bits(build_header(payload_size, flags))
+        total = HEADER_BITS + symbol_count(payload_size, bits_per_channel)
+        # Первая строка, которую встраивание уже не затрагивает
+        end_row = -(-total // row_size)
+
+        writer = PNGStripWriter(output, reader.width, reader.height, compress_level)
+        previous_row = None
+        try:
+            for row, raw in reader.iter_raw_strips():
+                # Полосы после нагрузки копируются как есть. Полоса со строкой end_row
+                # перекодируется: ее первая строка может ссылаться на измененную
+                if reader.passthrough and row > end_row:
+                    writer.write_raw(raw)
+                    continue
+
+                pixels = reader.decode_strip(raw, previous_row)
+                previous_row = pixels[-1]
+                strip = np.array(pixels[:, :, :3])
+
+                start = row * row_size
+                end = min(start + strip.size, total)
+                if end > start:
+                    # Символы только для значений каналов этой полосы
+                    symbols, masks = stream_symbols(payload, header_bits, start, end,
+                                                    bits_per_channel)
+                    strip_flat = strip.reshape(-1)
+                    set_lsb(strip_flat[:end - start], symbols, masks)
+
+                writer.write_rows(strip)
+        except Exception:
+            writer.abort()
+            raise
+        writer.close()
+
+    return True
+
+
+def extract_stream(source, strip_rows=DEFAULT_STRIP_ROWS):
+    # Полосы читаются только до конца нагрузки, дальше файл не декодируется
+    with PNGStripReader(source, strip_rows) as reader:
+        strips = reader.iter_strips()
+        values = np.empty(0, dtype=np.uint8)
+
+        # Значения каналов накапливаются, пока не будет прочитан заголовок
+        for _, pixels in strips:
+            values = np.concatenate((values, pixels[:, :, :3].reshape(-1)))
+            if values.size >= HEADER_BITS:
+                break
+
+        header = parse_header(unpack_symbols(values[:HEADER_BITS], HEADER_SIZE))
+        if header is None:
+            return _extract_legacy(values, strips)
+        if header['flags'] & FLAG_SCATTER:
+            # Рассеянная нагрузка занимает строки по всему изображению
+            raise ValueError("Потоковое извлечение не поддерживает рассеянную по ключу нагрузку")
+        if header['flags'] & FLAG_SHARD:
+            # Часть распределенной нагрузки начинается с заголовка части
+            raise ValueError("Изображение содержит часть распределенной нагрузки: "
+                             "используйте lsb_shard.extract_shards")
+        if header['flags'] & FLAG_MULTIFRAME:
+            # Нагрузка начинается с таблицы кадров и продолжается в следующих кадрах
+            raise ValueError("Изображение содержит многокадровую нагрузку: используйте LSBDecoder")
+
+        bits_per_channel = header['bits_per_channel']
+        if header['length'] > capacity_bytes(reader.width * reader.height * 3, bits_per_channel):
+            raise ValueError("Длина нагрузки превышает вместимость изображения")
+
+        needed = symbol_count(header['length'], bits_per_channel)
+        chunks = _payload_chunks(values[HEADER_BITS:], strips, needed, bits_per_channel)
+        if header['flags'] & FLAG_FEC:
+            chunks = [correct_frames(b''.join(chunks))[0]]
+        return b''.join(decompress_chunks(chunks, header['codec']))
+
+
+def _payload_chunks(values, strips, needed, bits_per_channel):
+    # Байты нагрузки по мере чтения полос: values — значения каналов после
+    # заголовка, уже прочитанные из первых полос; needed — число значений нагрузки
+    carry = np.zeros(0, dtype=np.uint8)
+    remaining = needed
+    while True:
+        block = values[:remaining]
+        remaining -= block.size
+        data, carry = unpack_block(block, carry, bits_per_channel)
+        yield data
+        if not remaining:
+            return
+
+        strip = next(strips, None)
+        if strip is None:
+            raise ValueError("Данные нагрузки обрезаны")
+        values = strip[1][:, :, :3].reshape(-1)
+
+
+def _extract_legacy(values, strips):
+    # Старый формат: поиск маркера [END] по мере чтения полос
+    data = bytearray()
+    leftover = np.empty(0, dtype=np.uint8)
+    search_from = 0
+
+    while True:
+        lsb = np.concatenate((leftover, values & 1))
+        usable = lsb.size - lsb.size % 8
+        data += np.packbits(lsb[:usable]).tobytes()
+        leftover = lsb[usable:]
+
+        index = data.find(LEGACY_END_MARKER, search_from)
+        if index != -1:
+            return bytes(data[:index])
+        search_from = max(0, len(data) - len(LEGACY_END_MARKER) + 1)
+
+        strip = next(strips, None)
+        if strip is None:
+            return bytes(data)
+        values = strip[1][:, :, :3].reshape(-1)
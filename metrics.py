@@ -1,82 +1,240 @@
 
-
 import numpy as np
-#import cv2
-from PIL import Image
-from skimage.metrics import structural_similarity
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+from image_io import is_path, load_pixels
+
+
+# Число значений каналов, обрабатываемых за один шаг при построчных вычислениях
+BLOCK_VALUES = 1 << 20
+
+# Параметры SSIM: размер окна (как в skimage по умолчанию) и размер плитки
+SSIM_WIN_SIZE = 7
+SSIM_TILE_SIZE = 256
+# Плиточный SSIM совпадает с полнокадровым с точностью до порядка суммирования:
+# в неизмененных областях карта SSIM равна 1.0 точно. Допустимое отклонение:
+SSIM_TILED_TOLERANCE = 1e-9
+
+
+def structural_similarity(*args, **kwargs):
+    # scikit-image (вместе с SciPy) загружается при первом расчете SSIM,
+    # а не при импорте модуля: MSE и PSNR считаются только на NumPy
+    from skimage.metrics import structural_similarity
+    return structural_similarity(*args, **kwargs)
 
 
 class ImageQualityMetrics:
-  
+
+    # Изображения можно передавать путями, байтами, файловыми объектами,
+    # изображениями PIL или массивами NumPy формы (H, W, 3)
 
     @staticmethod
-    def calculate_mse(original_path, stego_path):
-        
-        if not os.path.exists(original_path) or not os.path.exists(stego_path):
-            raise FileNotFoundError("Один или оба файла изображений не найдены")
+    def load_pair(original, stego):
+        # Загрузка (декодирование) каждого изображения ровно один раз
+        for source in (original, stego):
+            if is_path(source) and not os.path.exists(source):
+                raise FileNotFoundError("Один или оба файла изображений не найдены")
 
-        try:
-            # Загрузка изображений в RGB формате
-            original = np.array(Image.open(original_path).convert('RGB'), dtype=float)
-            stego = np.array(Image.open(stego_path).convert('RGB'), dtype=float)
+        with instrumentation.current().stage('metrics.load'):
+            original_pixels = load_pixels(original)[1]
+            stego_pixels = load_pixels(stego)[1]
 
-            # Проверка совпадения размеров
-            if original.shape != stego.shape:
-                raise ValueError("Размеры изображений не совпадают")
+        # Проверка совпадения размеров
+        if original_pixels.shape != stego_pixels.shape:
+            raise ValueError("Размеры изображений не совпадают")
 
-            # Расчет средней квадратической ошибки
-            mse = np.mean((original - stego) ** 2)
+        return original_pixels, stego_pixels
+
+    @staticmethod
+    def _row_blocks(pixels):
+        # Диапазоны строк, по которым идут вычисления без полных копий изображения
+        row_values = pixels.shape[1] * pixels.shape[2]
+        rows = max(1, BLOCK_VALUES // row_values)
+        for start in range(0, pixels.shape[0], rows):
+            yield slice(start, start + rows)
+
+    @staticmethod
+    def difference_stats(original_pixels, stego_pixels):
+        # Сумма квадратов и максимум модуля целочисленной разности, блоками строк
+        total = 0
+        max_diff = 0
+        with instrumentation.current().stage('metrics.mse', bytes=original_pixels.nbytes):
+            for rows in ImageQualityMetrics._row_blocks(original_pixels):
+                diff = np.subtract(original_pixels[rows], stego_pixels[rows], dtype=np.int32)
+                total += int(np.einsum('ijk,ijk->', diff, diff, dtype=np.int64))
+                if diff.size:
+                    max_diff = max(max_diff, int(np.abs(diff).max()))
+        return total, max_diff
 
-            return mse
+    @staticmethod
+    def squared_error_sum(original_pixels, stego_pixels):
+
+        return ImageQualityMetrics.difference_stats(original_pixels, stego_pixels)[0]
+
+    @staticmethod
+    def expected_lsb_distortion(bits_per_channel=1, used_fraction=1.0):
+        # Ожидаемые MSE и PSNR при замене младших bits_per_channel бит случайными
+        # данными в доле used_fraction значений каналов: для равномерно
+        # распределенных k-битных значений E[(a - b)^2] = (4^k - 1) / 6
+        mse = used_fraction * (4 ** bits_per_channel - 1) / 6
+        return {
+            'bits_per_channel': bits_per_channel,
+            'MSE': mse,
+            'PSNR': ImageQualityMetrics.psnr_from_mse(mse),
+            # Максимальное изменение значения канала
+            'MaxDiff': (1 << bits_per_channel) - 1
+        }
+
+    @staticmethod
+    def mse_from_arrays(original_pixels, stego_pixels):
+
+        if original_pixels.size == 0:
+            return 0.0
+        return ImageQualityMetrics.squared_error_sum(original_pixels, stego_pixels) / original_pixels.size
+
+    @staticmethod
+    def psnr_from_mse(mse):
+
+        # Обработка случая полного совпадения изображений
+        if mse == 0:
+            return float('inf')
+
+        # Максимальное значение пиксела для 8-битных изображений
+        max_pixel = 255
+
+        return 10 * np.log10((max_pixel ** 2) / mse)
+
+    @staticmethod
+    def to_grayscale(pixels):
+        # Преобразование RGB -> L по формуле Pillow (ITU-R 601-2), блоками строк
+        gray = np.empty(pixels.shape[:2], dtype=np.uint8)
+        for rows in ImageQualityMetrics._row_blocks(pixels):
+            block = pixels[rows].astype(np.uint32)
+            gray[rows] = (block[..., 0] * 19595 + block[..., 1] * 38470
+                          + block[..., 2] * 7471 + 0x8000) >> 16
+        return gray
+
+    @staticmethod
+    def ssim_from_arrays(original_pixels, stego_pixels, channels='gray', tiled=False,
+                         tile_size=SSIM_TILE_SIZE, workers=None):
+        # channels='gray' — SSIM по яркости, 'rgb' — среднее SSIM по каналам R, G, B.
+        # tiled=True — окна считаются только по плиткам с изменениями (и их соседям)
+        with instrumentation.current().stage('metrics.ssim', bytes=original_pixels.nbytes):
+            if channels == 'gray':
+                planes = [(ImageQualityMetrics.to_grayscale(original_pixels),
+                           ImageQualityMetrics.to_grayscale(stego_pixels))]
+            elif channels == 'rgb':
+                planes = [(original_pixels[:, :, c], stego_pixels[:, :, c]) for c in range(3)]
+            else:
+                raise ValueError(f"Неизвестный режим каналов SSIM: {channels}")
+
+            values = []
+            for original_plane, stego_plane in planes:
+                if tiled:
+                    values.append(ImageQualityMetrics.tiled_ssim(
+                        original_plane, stego_plane, tile_size, workers))
+                else:
+                    values.append(structural_similarity(
+                        np.ascontiguousarray(original_plane), np.ascontiguousarray(stego_plane),
+                        win_size=SSIM_WIN_SIZE, data_range=255))
+            return float(np.mean(values))
+
+    @staticmethod
+    def tiled_ssim(original_plane, stego_plane, tile_size=SSIM_TILE_SIZE, workers=None):
+        # Карта SSIM отличается от 1.0 только там, где окно задевает измененный
+        # пиксель. Поэтому точно считаются лишь плитки с изменениями и соседние
+        # с ними плитки (окно меньше плитки), остальные дают ровно 1.0
+        height, width = original_plane.shape
+        pad = (SSIM_WIN_SIZE - 1) // 2
+        valid_count = (height - 2 * pad) * (width - 2 * pad)
+        if height < 2 * SSIM_WIN_SIZE or width < 2 * SSIM_WIN_SIZE or tile_size <= SSIM_WIN_SIZE:
+            return structural_similarity(np.ascontiguousarray(original_plane),
+                                         np.ascontiguousarray(stego_plane),
+                                         win_size=SSIM_WIN_SIZE, data_range=255)
+
+        tiles_y = -(-height // tile_size)
+        tiles_x = -(-width // tile_size)
+        dirty = np.zeros((tiles_y, tiles_x), dtype=bool)
+        for rows in ImageQualityMetrics._row_blocks(original_plane[:, :, None]):
+            changed_y, changed_x = np.nonzero(original_plane[rows] != stego_plane[rows])
+            dirty[(changed_y + rows.start) // tile_size, changed_x // tile_size] = True
+
+        # Расширение на соседние плитки: окно у границы плитки видит пиксели соседней
+        affected = dirty.copy()
+        affected[1:] |= dirty[:-1]
+        affected[:-1] |= dirty[1:]
+        affected[:, 1:] |= affected[:, :-1].copy()
+        affected[:, :-1] |= affected[:, 1:].copy()
+
+        def tile_sum(tile):
+            ty, tx = tile
+            y0, y1 = ty * tile_size, min((ty + 1) * tile_size, height)
+            x0, x1 = tx * tile_size, min((tx + 1) * tile_size, width)
+            # Поле вокруг плитки размером с окно дает те же значения фильтров, что и в полном кадре
+            cy0, cy1 = max(0, y0 - SSIM_WIN_SIZE), min(height, y1 + SSIM_WIN_SIZE)
+            cx0, cx1 = max(0, x0 - SSIM_WIN_SIZE), min(width, x1 + SSIM_WIN_SIZE)
+            _, ssim_map = structural_similarity(
+                np.ascontiguousarray(original_plane[cy0:cy1, cx0:cx1]),
+                np.ascontiguousarray(stego_plane[cy0:cy1, cx0:cx1]),
+                win_size=SSIM_WIN_SIZE, data_range=255, full=True)
+
+            # Пересечение плитки с областью, по которой skimage усредняет карту
+            vy0, vy1 = max(y0, pad), min(y1, height - pad)
+            vx0, vx1 = max(x0, pad), min(x1, width - pad)
+            if vy0 >= vy1 or vx0 >= vx1:
+                return 0.0, 0
+            region = ssim_map[vy0 - cy0:vy1 - cy0, vx0 - cx0:vx1 - cx0]
+            return float(region.sum(dtype=np.float64)), region.size
+
+        tiles = list(zip(*np.nonzero(affected)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(tile_sum, tiles))
+
+        computed_sum = sum(result[0] for result in results)
+        computed_count = sum(result[1] for result in results)
+        return (computed_sum + (valid_count - computed_count)) / valid_count
+
+    @staticmethod
+    def calculate_mse(original_path, stego_path):
+
+        original, stego = ImageQualityMetrics.load_pair(original_path, stego_path)
+
+        try:
+            # Расчет средней квадратической ошибки
+            return ImageQualityMetrics.mse_from_arrays(original, stego)
 
         except Exception as e:
             raise Exception(f"Ошибка при расчете MSE: {str(e)}")
 
     @staticmethod
     def calculate_psnr(original_path, stego_path):
-       
+
         try:
             mse = ImageQualityMetrics.calculate_mse(original_path, stego_path)
 
-            # Обработка случая полного совпадения изображений
-            if mse == 0:
-                return float('inf')
-
-            # Максимальное значение пиксела для 8-битных изображений
-            max_pixel = 255
-
             # Расчет PSNR
-            psnr = 10 * np.log10((max_pixel ** 2) / mse)
-
-            return psnr
+            return ImageQualityMetrics.psnr_from_mse(mse)
 
         except Exception as e:
             raise Exception(f"Ошибка при расчете PSNR: {str(e)}")
 
     @staticmethod
-    def calculate_ssim(original_path, stego_path):
-        from PIL import Image
-        import numpy as np
-        from skimage.metrics import structural_similarity
+    def calculate_ssim(original_path, stego_path, channels='gray', tiled=False, workers=None):
 
         try:
             # Загружаем через Pillow (она нормально работает с путями и кириллицей)
-            original = Image.open(original_path).convert('L')
-            stego = Image.open(stego_path).convert('L')
+            original, stego = ImageQualityMetrics.load_pair(original_path, stego_path)
         except Exception:
             # Если вдруг не удалось – просто возвращаем 1.0, чтобы не ронять всё приложение
             return 1.0
 
-        original_np = np.array(original)
-        stego_np = np.array(stego)
-
-        ssim = structural_similarity(original_np, stego_np)
-        return ssim
+        return ImageQualityMetrics.ssim_from_arrays(original, stego, channels, tiled, workers=workers)
 
     @staticmethod
     def evaluate_quality(psnr):
-       
+
         if psnr >= 50:
             return "Отличное (изменения визуально неразличимы)"
         elif psnr >= 40:
@@ -86,20 +244,45 @@ class ImageQualityMetrics:
         else:
             return "Плохое (явные искажения)"
 
+    @staticmethod
+    def report_from_embed(embed_report, ssim=None):
+        # Отчет в формате get_full_report по статистике, собранной при встраивании;
+        # SSIM добавляется только если он был рассчитан отдельно. ExpectedPSNR —
+        # оценка для случайных данных той же глубины и доли значений каналов
+        report = {
+            'MSE': round(embed_report['MSE'], 4),
+            'PSNR': round(embed_report['PSNR'], 2)
+        }
+        if ssim is not None:
+            report['SSIM'] = round(ssim, 4)
+        report['Quality'] = ImageQualityMetrics.evaluate_quality(embed_report['PSNR'])
+        if 'bits_per_channel' in embed_report:
+            expected = ImageQualityMetrics.expected_lsb_distortion(
+                embed_report['bits_per_channel'], embed_report['used_fraction'])
+            report['ExpectedPSNR'] = round(float(expected['PSNR']), 2)
+        return report
+
     @staticmethod
     def get_full_report(original_path, stego_path):
-       
+        # Каждое изображение декодируется один раз, MSE/PSNR и SSIM считаются
+        # по одним и тем же массивам
         try:
-            mse = ImageQualityMetrics.calculate_mse(original_path, stego_path)
-            psnr = ImageQualityMetrics.calculate_psnr(original_path, stego_path)
-            ssim = ImageQualityMetrics.calculate_ssim(original_path, stego_path)
+            original, stego = ImageQualityMetrics.load_pair(original_path, stego_path)
+
+            squared_error, max_diff = ImageQualityMetrics.difference_stats(original, stego)
+            mse = squared_error / original.size if original.size else 0.0
+            psnr = ImageQualityMetrics.psnr_from_mse(mse)
+            # Плиточный SSIM: окна считаются только вокруг измененных областей
+            ssim = ImageQualityMetrics.ssim_from_arrays(original, stego, tiled=True)
             quality = ImageQualityMetrics.evaluate_quality(psnr)
 
             return {
                 'MSE': round(mse, 4),
                 'PSNR': round(psnr, 2),
                 'SSIM': round(ssim, 4),
-                'Quality': quality
+                'Quality': quality,
+                # Максимальное изменение канала показывает глубину встраивания (2^k - 1)
+                'MaxDiff': max_diff
             }
         except Exception as e:
             raise Exception(f"Ошибка при получении отчета: {str(e)}")
@@ -113,4 +296,4 @@ if __name__ == "__main__":
         for key, value in report.items():
             print(f"  {key}: {value}")
     except Exception as e:
-        print(f"Ошибка: {e}")
\ No newline at end of file
+        print(f"Ошибка: {e}")
@@ -0,0 +1,274 @@
+"""
+Потоковое чтение и запись PNG горизонтальными полосами.
+Позволяет обрабатывать изображения, которые не помещаются в память:
+одновременно хранится только одна полоса строк. Анимированные PNG (APNG)
+записываются так же, кадр за кадром.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Размер порции при чтении и записи данных IDAT
+IO_BLOCK_SIZE = 1 << 16
+
+# Тип цвета PNG -> (число каналов, режим PIL)
+COLOR_TYPES = {
+    2: (3, 'RGB'),
+    6: (4, 'RGBA')
+}
+
+
+class PNGStripReader:
+    #Построчное чтение 8-битных PNG (RGB/RGBA) без чересстрочной развертки.
+
+    def __init__(self, source, strip_rows=256):
+        # source: путь к файлу или файлоподобный объект с методом read
+        self._own_file = isinstance(source, str) or hasattr(source, '__fspath__')
+        self.file = open(source, 'rb') if self._own_file else source
+        self.strip_rows = strip_rows
+
+        try:
+            if self.file.read(8) != PNG_SIGNATURE:
+                raise ValueError("Файл не является изображением PNG")
+
+            length, chunk_type = self._read_chunk_header()
+            if chunk_type != b'IHDR':
+                raise ValueError("Отсутствует заголовок IHDR")
+            ihdr = self.file.read(length)
+            self.file.read(4)
+
+            (self.width, self.height, bit_depth, color_type,
+             _, _, interlace) = struct.unpack('>IIBBBBB', ihdr)
+        except Exception:
+            self.close()
+            raise
+
+        if bit_depth != 8 or color_type not in COLOR_TYPES or interlace != 0:
+            self.close()
+            raise ValueError(
+                "Потоковый режим поддерживает только 8-битные PNG (RGB/RGBA) "
+                "без чересстрочной развертки"
+            )
+
+        self.channels, self.mode = COLOR_TYPES[color_type]
+        self.stride = self.width * self.channels + 1
+        # Строки RGB можно копировать в выходной файл без декодирования
+        self.passthrough = color_type == 2
+
+    def _read_chunk_header(self):
+
+        data = self.file.read(8)
+        if len(data) < 8:
+            raise ValueError("Неожиданный конец файла PNG")
+        return struct.unpack('>I4s', data)
+
+    def _iter_idat(self):
+        # Данные IDAT читаются порциями, даже если блок очень большой
+        while True:
+            length, chunk_type = self._read_chunk_header()
+            if chunk_type == b'IEND':
+                return
+            if chunk_type != b'IDAT':
+                self.file.seek(length + 4, 1)
+                continue
+
+            remaining = length
+            while remaining:
+                block = self.file.read(min(remaining, IO_BLOCK_SIZE))
+                if not block:
+                    raise ValueError("Неожиданный конец файла PNG")
+                remaining -= len(block)
+                yield block
+            self.file.read(4)
+
+    def iter_raw_strips(self):
+        #Возвращает пары (номер первой строки, отфильтрованные байты строк полосы).
+        decompressor = zlib.decompressobj()
+        buffer = bytearray()
+        row = 0
+        strip_bytes = self.strip_rows * self.stride
+
+        for block in self._iter_idat():
+            data = block
+            while data:
+                # Ограничение размера распакованных данных держит память в пределах полосы
+                buffer += decompressor.decompress(data, strip_bytes)
+                data = decompressor.unconsumed_tail
+                while len(buffer) >= strip_bytes and row < self.height:
+                    rows = min(self.strip_rows, self.height - row)
+                    yield row, bytes(buffer[:rows * self.stride])
+                    del buffer[:rows * self.stride]
+                    row += rows
+
+        buffer += decompressor.flush()
+        while row < self.height:
+            rows = min(self.strip_rows, self.height - row)
+            if len(buffer) < rows * self.stride:
+                raise ValueError("Данные изображения PNG обрезаны")
+            yield row, bytes(buffer[:rows * self.stride])
+            del buffer[:rows * self.stride]
+            row += rows
+
+    def decode_strip(self, raw, previous_row=None):
+        # Снятие фильтров PNG выполняет декодер Pillow; предыдущая строка
+        # (уже без фильтра) добавляется в начало, чтобы фильтры Up/Average/Paeth
+        # первой строки полосы восстановились правильно
+        rows = len(raw) // self.stride
+        if previous_row is not None:
+            prefix = b'\x00' + previous_row.tobytes()
+            raw = prefix + raw
+            rows += 1
+
+        from PIL import Image
+        image = Image.frombytes(self.mode, (self.width, rows),
+                                zlib.compress(raw, 0), 'zip', self.mode)
+        pixels = np.asarray(image)
+        if previous_row is not None:
+            pixels = pixels[1:]
+        return pixels
+
+    def iter_strips(self):
+        #Возвращает пары (номер первой строки, пиксели полосы формы (rows, W, каналы)).
+        previous_row = None
+        for row, raw in self.iter_raw_strips():
+            pixels = self.decode_strip(raw, previous_row)
+            previous_row = pixels[-1]
+            yield row, pixels
+
+    def close(self):
+
+        if self._own_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PNGStripWriter:
+    #Последовательная запись 8-битного RGB PNG полосами строк.
+
+    def __init__(self, output, width, height, compress_level=6):
+        # output: путь к файлу или файлоподобный объект с методом write
+        self._own_file = isinstance(output, str) or hasattr(output, '__fspath__')
+        self.file = open(output, 'wb') if self._own_file else output
+        self.width = width
+        self.height = height
+        self.compress_level = compress_level
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = bytearray()
+
+        self.file.write(PNG_SIGNATURE)
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def _write_chunk(self, chunk_type, data):
+
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    def _write_data(self, data):
+
+        self._write_chunk(b'IDAT', data)
+
+    def _feed(self, raw):
+
+        self._pending += self._compressor.compress(raw)
+        while len(self._pending) >= IO_BLOCK_SIZE:
+            self._write_data(bytes(self._pending[:IO_BLOCK_SIZE]))
+            del self._pending[:IO_BLOCK_SIZE]
+
+    def write_raw(self, raw):
+        # Запись уже отфильтрованных строк (копирование без перекодирования)
+        self.rows_written += len(raw) // (self.width * 3 + 1)
+        self._feed(raw)
+
+    def write_rows(self, pixels):
+        # Фильтр Sub (тип 1): разность с соседним слева пикселем, векторно по всей полосе
+        filtered = pixels.copy()
+        filtered[:, 1:] -= pixels[:, :-1]
+
+        rows = pixels.shape[0]
+        raw = np.empty((rows, self.width * 3 + 1), dtype=np.uint8)
+        raw[:, 0] = 1
+        raw[:, 1:] = filtered.reshape(rows, -1)
+
+        self.rows_written += rows
+        self._feed(raw.tobytes())
+
+    def _flush_rows(self):
+        # Завершение потока сжатых строк текущего изображения (кадра)
+        if self.rows_written != self.height:
+            raise ValueError(
+                f"Записано строк: {self.rows_written}, ожидалось: {self.height}"
+            )
+
+        self._pending += self._compressor.flush()
+        for start in range(0, len(self._pending), IO_BLOCK_SIZE):
+            self._write_data(bytes(self._pending[start:start + IO_BLOCK_SIZE]))
+        self._pending.clear()
+
+    def close(self):
+
+        self._flush_rows()
+        self._write_chunk(b'IEND', b'')
+
+        if self._own_file:
+            self.file.close()
+
+    def abort(self):
+        # Закрытие без дописывания конца файла (при ошибке обработки)
+        if self._own_file:
+            self.file.close()
+
+
+class APNGWriter(PNGStripWriter):
+    #Последовательная запись анимированного PNG: кадры одного размера, по одному.
+
+    def __init__(self, output, width, height, frame_count, loop=0, compress_level=6):
+        super().__init__(output, width, height, compress_level)
+        self.frame_count = frame_count
+        self.frame_index = -1
+        # Номер очередного фрагмента fcTL/fdAT (общая нумерация для всего файла)
+        self.sequence = 0
+        self._write_chunk(b'acTL', struct.pack('>II', frame_count, loop))
+
+    def _write_data(self, data):
+        # Первый кадр хранится в IDAT (его видят программы без поддержки APNG),
+        # остальные — во фрагментах fdAT с порядковым номером
+        if self.frame_index == 0:
+            self._write_chunk(b'IDAT', data)
+        else:
+            self._write_chunk(b'fdAT', struct.pack('>I', self.sequence) + data)
+            self.sequence += 1
+
+    def begin_frame(self, duration=100):
+        # duration: длительность кадра в миллисекундах
+        if self.frame_index >= 0:
+            self._flush_rows()
+        if self.frame_index + 1 >= self.frame_count:
+            raise ValueError(f"Число кадров превышает объявленное ({self.frame_count})")
+
+        self.frame_index += 1
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(self.compress_level)
+        # Кадр во весь холст без смешивания и очистки: (x, y) = (0, 0),
+        # задержка duration / 1000 с
+        self._write_chunk(b'fcTL', struct.pack('>IIIIIHHBB', self.sequence, self.width, self.height,
+                                               0, 0, int(duration), 1000, 0, 0))
+        self.sequence += 1
+
+    def close(self):
+
+        if self.frame_index + 1 != self.frame_count:
+            raise ValueError(f"Записано кадров: {self.frame_index + 1}, ожидалось: {self.frame_count}")
+        super().close()
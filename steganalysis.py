@@ -0,0 +1,168 @@
+"""
+Обнаружение LSB-нагрузки в изображениях (стегоанализ).
+Атака хи-квадрат (Вестфельд) сравнивает частоты пар значений 2k и 2k+1,
+которые выравниваются при записи случайных бит в младший разряд; в режиме
+нарастающих окон она показывает, где в потоке каналов заканчивается нагрузка.
+RS-анализ (Фридрих) оценивает долю измененных пикселей по регулярным и
+сингулярным группам соседних значений. Гистограммы и подсчет групп
+выполняются над массивами NumPy целиком, без циклов по пикселям.
+"""
+
+import numpy as np
+
+from image_io import load_pixels
+
+
+# Пары с ожидаемой частотой меньше этой величины не учитываются в хи-квадрат
+MIN_EXPECTED = 5
+# Размер группы RS-анализа: соседние значения строки одного канала
+RS_GROUP = 4
+# Число значений каналов, гистограммы окон которых строятся за один проход
+HISTOGRAM_BLOCK_VALUES = 1 << 22
+
+# Пороги, выше которых изображение считается подозрительным
+CHI_SQUARE_THRESHOLD = 0.95
+RS_THRESHOLD = 0.1
+WINDOW_THRESHOLD = 0.95
+
+
+def _chi_square_pvalues(histograms):
+    # histograms: (n, 256). Вероятность того, что частоты пар выровнены
+    # записью случайных бит, для каждой строки
+    from scipy.special import gammaincc
+
+    even = histograms[:, 0::2].astype(np.float64)
+    odd = histograms[:, 1::2].astype(np.float64)
+    expected = (even + odd) / 2
+    used = expected >= MIN_EXPECTED
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(used, (even - expected) ** 2 / expected, 0.0)
+    statistic = terms.sum(axis=1)
+    freedom = used.sum(axis=1) - 1
+
+    pvalues = np.zeros(len(histograms))
+    valid = freedom > 0
+    pvalues[valid] = gammaincc(freedom[valid] / 2, statistic[valid] / 2)
+    return pvalues
+
+
+def chi_square(values):
+    # Атака хи-квадрат по всем значениям каналов
+    histogram = np.bincount(np.ravel(values), minlength=256)
+    return float(_chi_square_pvalues(histogram[None, :])[0])
+
+
+def chi_square_profile(values, window):
+    # Атака хи-квадрат по нарастающим префиксам из целого числа окон по window
+    # значений каналов (в порядке встраивания): при последовательной записи
+    # вероятность остается высокой, пока префикс не выходит за конец нагрузки
+    values = np.ravel(values)
+    windows = values.size // window
+    if windows == 0:
+        return np.zeros(0)
+
+    # Гистограммы строятся блоками окон: индексы int32 занимают память
+    # одного блока, а не всего изображения
+    histograms = np.empty((windows, 256), dtype=np.int64)
+    step = max(1, HISTOGRAM_BLOCK_VALUES // window)
+    for first in range(0, windows, step):
+        last = min(windows, first + step)
+        index = np.repeat(np.arange(last - first, dtype=np.int32) * 256, window)
+        index += values[first * window:last * window]
+        histograms[first:last] = np.bincount(index, minlength=(last - first) * 256).reshape(-1, 256)
+    return _chi_square_pvalues(np.cumsum(histograms, axis=0))
+
+
+def locate_payload(profile, window, threshold=WINDOW_THRESHOLD):
+    # Область (начало, конец) в значениях каналов, занятая последовательной
+    # нагрузкой, или None. Нагрузка начинается с первого значения канала
+    if profile.size == 0 or profile[0] <= threshold:
+        return None
+    end = int(np.flatnonzero(profile > threshold)[-1]) + 1
+    return 0, end * window
+
+
+def _smoothness(x0, x1, x2, x3):
+
+    return np.abs(x1 - x0) + np.abs(x2 - x1) + np.abs(x3 - x2)
+
+
+def _rs_counts(columns):
+    # Числа регулярных и сингулярных групп для масок M и -M. columns — четыре
+    # столбца значений групп; маска [0, 1, 1, 0] меняет два средних
+    x0, x1, x2, x3 = columns
+    smoothness = _smoothness(x0, x1, x2, x3)
+    counts = []
+    for flip in (lambda x: x ^ 1, lambda x: ((x + 1) ^ 1) - 1):
+        changed = _smoothness(x0, flip(x1), flip(x2), x3)
+        counts.append((np.count_nonzero(changed > smoothness), np.count_nonzero(changed < smoothness)))
+    return counts
+
+
+def rs_analysis(pixels):
+    # Оценка доли пикселей с измененным младшим битом (0..1) по всем каналам
+    pixels = np.asarray(pixels)
+    width = pixels.shape[1] - pixels.shape[1] % RS_GROUP
+    if width == 0:
+        return 0.0
+
+    # Группы по 4 соседних значения в строке каждого канала
+    planes = np.moveaxis(pixels[:, :width].astype(np.int16), -1, 0)
+    groups = planes.reshape(-1, RS_GROUP)
+    total = len(groups)
+    columns = [np.ascontiguousarray(groups[:, i]) for i in range(RS_GROUP)]
+
+    # Статистики для изображения и для изображения с инвертированными младшими битами
+    (r0, s0), (rn0, sn0) = _rs_counts(columns)
+    (r1, s1), (rn1, sn1) = _rs_counts([column ^ 1 for column in columns])
+    d0, d1 = (r0 - s0) / total, (r1 - s1) / total
+    dn0, dn1 = (rn0 - sn0) / total, (rn1 - sn1) / total
+
+    a = 2 * (d1 + d0)
+    b = dn0 - dn1 - d1 - 3 * d0
+    c = d0 - dn0
+    if a == 0:
+        if b == 0:
+            return 0.0
+        root = -c / b
+    else:
+        discriminant = b * b - 4 * a * c
+        if discriminant < 0:
+            # При записи почти во все пиксели корни становятся комплексными:
+            # используется вершина параболы
+            discriminant = 0.0
+        roots = ((-b + discriminant ** 0.5) / (2 * a), (-b - discriminant ** 0.5) / (2 * a))
+        root = min(roots, key=abs)
+
+    if root == 0.5:
+        return 1.0
+    return float(min(1.0, max(0.0, root / (root - 0.5))))
+
+
+def analyze(source, window=None):
+    # Оценки для одного изображения. window — размер окна (в значениях каналов)
+    # для поиска области нагрузки; по умолчанию окно не используется
+    try:
+        _, pixels, _ = load_pixels(source)
+        values = pixels.reshape(-1)
+        height, width = pixels.shape[:2]
+
+        result = {
+            'width': width,
+            'height': height,
+            'chi_square': chi_square(values),
+            'rs_estimate': rs_analysis(pixels)
+        }
+        suspicious = (result['chi_square'] > CHI_SQUARE_THRESHOLD
+                      or result['rs_estimate'] > RS_THRESHOLD)
+
+        if window:
+            region = locate_payload(chi_square_profile(values, window), window)
+            result['region'] = list(region) if region else None
+            suspicious = suspicious or region is not None
+
+        result['suspicious'] = bool(suspicious)
+        return result
+    except Exception as e:
+        raise Exception(f"Ошибка при анализе изображения: {str(e)}")
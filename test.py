@@ -1,10 +1,31 @@
 import unittest
+import asyncio
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 import os
+import tempfile
 import numpy as np
 from PIL import Image
 from lsb_encoder import LSBEncoder
 from lsb_decoder import LSBDecoder
-from metrics import ImageQualityMetrics
+from metrics import SSIM_TILED_TOLERANCE, ImageQualityMetrics
+from lsb_format import HEADER_SIZE, parse_header
+from lsb_stream import embed_stream, extract_stream
+from lsb_batch import _check_collisions, iter_images, run_batch
+from lsb_shard import embed_shards, extract_shards
+from lsb_progress import CancelledError, CancelToken
+from lsb_service import LSBService
+from benchmark import HEAVY_MODULES, STAGES, compare_results, run_benchmark
+from steganalysis import analyze
+from instrumentation import collect, current
+from image_cache import ImageCache, get_cache
+from lsb_multiframe import embed_frames
+from lsb_scatter import scatter_positions
 
 class TestLSBSteganography(unittest.TestCase):
     
@@ -64,6 +85,339 @@ class TestLSBSteganography(unittest.TestCase):
         
         self.assertEqual(self.message, extracted_message)
 
+    def test_embedded_bits_match_binary_format(self):
+        #"""Тест совпадения векторного встраивания с побитовым форматом"""
+        self.encoder.embed_data(self.message, self.stego_image_name, legacy=True)
+
+        expected = self.encoder.text_to_binary(self.message + '[END]')
+        stego = np.array(Image.open(self.stego_image_name)).reshape(-1)
+        actual = ''.join(str(value & 1) for value in stego[:len(expected)])
+        self.assertEqual(expected, actual)
+
+    def test_extraction_of_long_message(self):
+        #"""Тест извлечения сообщения, занимающего несколько порций чтения"""
+        long_message = "Long message. " * 60
+        self.encoder.embed_data(long_message, self.stego_image_name, legacy=True)
+
+        decoder = LSBDecoder(self.stego_image_name)
+        decoder.INITIAL_CHUNK_BYTES = 7
+        self.assertEqual(long_message, decoder.extract_data())
+
+    def test_header_format_keeps_end_marker_in_message(self):
+        #"""Тест формата с заголовком: сообщение с [END] не обрезается"""
+        message = "before [END] after"
+        self.encoder.embed_data(message, self.stego_image_name)
+
+        decoder = LSBDecoder(self.stego_image_name)
+        self.assertEqual(parse_header(decoder.read_bytes(0, HEADER_SIZE))['length'], len(message))
+        self.assertEqual(message, decoder.extract_data())
+
+    def test_legacy_format_autodetection(self):
+        #"""Тест автоопределения старого формата с маркером [END]"""
+        self.encoder.embed_data(self.message, self.stego_image_name, legacy=True)
+
+        decoder = LSBDecoder(self.stego_image_name)
+        self.assertIsNone(parse_header(decoder.read_bytes(0, HEADER_SIZE)))
+        self.assertEqual(self.message, decoder.extract_data())
+
+    def test_utf8_message_roundtrip(self):
+        #"""Тест встраивания текста с символами вне Latin-1"""
+        message = "Привет, мир! 你好 🙂"
+        self.encoder.embed_data(message, self.stego_image_name)
+
+        decoder = LSBDecoder(self.stego_image_name)
+        self.assertEqual(message, decoder.extract_data())
+
+    def test_binary_payload_roundtrip(self):
+        #"""Тест встраивания произвольных двоичных данных"""
+        payload = bytes(range(256)) * 3
+        self.encoder.embed_bytes(memoryview(payload), self.stego_image_name)
+
+        decoder = LSBDecoder(self.stego_image_name)
+        self.assertEqual(payload, decoder.extract_bytes())
+
+    def test_capacity_is_checked_in_bytes(self):
+        #"""Тест проверки вместимости по размеру в байтах, а не в символах"""
+        # 600 символов кириллицы занимают 1200 байт в UTF-8 (> 927)
+        with self.assertRaises(ValueError):
+            self.encoder.embed_data("Я" * 600, self.stego_image_name)
+
+    def test_in_memory_sources_and_outputs(self):
+        #"""Тест работы с изображениями в памяти без файлов на диске"""
+        with open(self.test_image_name, 'rb') as f:
+            container_bytes = f.read()
+
+        encoder = LSBEncoder(container_bytes)
+        stego_bytes = encoder.embed_to_buffer(self.message)
+        self.assertEqual(self.message, LSBDecoder(io.BytesIO(stego_bytes)).extract_data())
+
+        stego_array = LSBEncoder(encoder.pixels).embed_to_array(b"raw")
+        self.assertEqual(b"raw", LSBDecoder(stego_array).extract_bytes())
+        self.assertEqual(b"raw", LSBDecoder(Image.fromarray(stego_array)).extract_bytes())
+
+        buffer = io.BytesIO()
+        encoder.embed_bytes(b"file-like", buffer)
+        self.assertEqual(b"file-like", LSBDecoder(buffer.getvalue()).extract_bytes())
+
+    def test_streaming_embedding_and_extraction(self):
+        #"""Тест потокового режима: результат совпадает с обычным встраиванием"""
+        y, x = np.mgrid[0:120, 0:90]
+        gradient = np.stack([(x + y) % 256, (2 * x) % 256, (3 * y) % 256], axis=-1)
+        Image.fromarray(gradient.astype(np.uint8)).save(self.test_image_name, optimize=True)
+
+        payload = bytes(range(256)) * 8
+        for bits_per_channel in (1, 3):
+            embed_stream(self.test_image_name, payload, self.stego_image_name, strip_rows=16,
+                         bits_per_channel=bits_per_channel)
+
+            expected = LSBEncoder(self.test_image_name, bits_per_channel).embed_to_array(payload)
+            np.testing.assert_array_equal(expected, np.array(Image.open(self.stego_image_name)))
+            self.assertEqual(payload, extract_stream(self.stego_image_name, strip_rows=10))
+
+        # Флаги сжатия и коррекции не должны затирать глубину встраивания
+        embed_stream(self.test_image_name, payload, self.stego_image_name, strip_rows=16,
+                     bits_per_channel=2, compression='zlib', error_correction=True)
+        self.assertEqual(payload, extract_stream(self.stego_image_name, strip_rows=10))
+        self.assertEqual(payload, LSBDecoder(self.stego_image_name).extract_bytes())
+
+    def test_bmp_memory_mapped_embedding(self):
+        #"""Тест встраивания в несжатый BMP через отображение в память"""
+        bmp_name = "test_base.bmp"
+        stego_bmp_name = "test_stego.bmp"
+        # Нечетная ширина проверяет выравнивание строк BMP по 4 байта
+        pixels = np.random.default_rng(0).integers(0, 256, (40, 53, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(bmp_name)
+        try:
+            encoder = LSBEncoder(bmp_name)
+            self.assertIsInstance(encoder.pixels, np.memmap)
+            encoder.embed_bytes(self.message, stego_bmp_name)
+
+            expected = LSBEncoder(pixels).embed_to_array(self.message)
+            np.testing.assert_array_equal(expected, np.array(Image.open(stego_bmp_name)))
+            np.testing.assert_array_equal(pixels, np.array(Image.open(bmp_name)))
+
+            decoder = LSBDecoder(stego_bmp_name)
+            self.assertIsInstance(decoder.pixels, np.memmap)
+            self.assertEqual(self.message, decoder.extract_data())
+            del encoder, decoder
+        finally:
+            for name in (bmp_name, stego_bmp_name):
+                if os.path.exists(name):
+                    os.remove(name)
+
+    def test_batch_embed_and_extract(self):
+        #"""Тест пакетной обработки каталога пулом процессов"""
+        with tempfile.TemporaryDirectory() as input_dir, tempfile.TemporaryDirectory() as output_dir:
+            for i in range(3):
+                Image.new('RGB', (30, 30), color=(i * 40, 0, 0)).save(os.path.join(input_dir, f"{i}.png"))
+
+            job = {'payload': self.message.encode('utf-8'), 'output_dir': output_dir}
+            results = list(run_batch('embed', iter_images(input_dir), job, workers=2, chunksize=1))
+            self.assertEqual(3, len(results))
+            self.assertTrue(all(result['status'] == 'ok' for result in results))
+
+            results = list(run_batch('extract', iter_images(output_dir), {}, workers=2))
+            self.assertEqual([self.message] * 3, [result['message'] for result in results])
+
+        # Одноименные файлы из подкаталогов и с разными расширениями не перезаписывают друг друга
+        with tempfile.TemporaryDirectory() as input_dir, tempfile.TemporaryDirectory() as output_dir:
+            for name in ('a/x.png', 'b/x.png', 'x.png', 'x.bmp'):
+                os.makedirs(os.path.dirname(os.path.join(input_dir, name)), exist_ok=True)
+                Image.new('RGB', (30, 30)).save(os.path.join(input_dir, name))
+
+            job = {'payload': b'data', 'output_dir': output_dir, 'input_dir': input_dir}
+            results = list(run_batch('embed', iter_images(input_dir, recursive=True), job, workers=2))
+            outputs = sorted(os.path.relpath(result['output'], output_dir) for result in results)
+            self.assertEqual([os.path.join('a', 'x.png'), os.path.join('b', 'x.png'),
+                              'x.bmp.png', 'x.png'], outputs)
+
+            Image.new('RGB', (30, 30)).save(os.path.join(input_dir, 'x.bmp.png'))
+            with self.assertRaises(ValueError):
+                list(_check_collisions(iter_images(input_dir), output_dir, '.png', input_dir))
+
+    def test_payload_sharding(self):
+        #"""Тест распределения нагрузки по нескольким изображениям и сборки в любом порядке"""
+        payload = os.urandom(2500)
+        with tempfile.TemporaryDirectory() as input_dir, tempfile.TemporaryDirectory() as output_dir:
+            sources = []
+            for i in range(5):
+                sources.append(os.path.join(input_dir, f"{i}.png"))
+                Image.new('RGB', (30, 30), color=(i * 40, 0, 0)).save(sources[-1])
+            outputs = [os.path.join(output_dir, f"{i}.png") for i in range(5)]
+
+            # Вместимость одного изображения 30x30 — 327 байт, нужно 8 частей: не хватает
+            with self.assertRaises(ValueError):
+                embed_shards(payload, sources, outputs, workers=2)
+
+            payload = payload[:1000]
+            reports = embed_shards(payload, sources, outputs, workers=2)
+            self.assertEqual(4, len(reports))
+            self.assertFalse(os.path.exists(outputs[4]))
+
+            used = outputs[:4]
+            self.assertEqual(payload, extract_shards(list(reversed(used)), workers=2))
+            with self.assertRaises(ValueError):
+                extract_shards(used[1:], workers=2)
+            with self.assertRaises(Exception):
+                LSBDecoder(used[0]).extract_bytes()
+            with self.assertRaises(ValueError):
+                extract_stream(used[0])
+
+    def test_error_correction(self):
+        #"""Тест помехоустойчивого кодирования: исправление одиночных ошибок и отчет по блокам"""
+        encoder = LSBEncoder(self.test_image_name, error_correction=True)
+        self.assertLess(encoder.calculate_capacity(), LSBEncoder(self.test_image_name).calculate_capacity())
+        payload = b"integrity checked payload " * 10
+        stego = encoder.embed_to_array(payload)
+
+        decoder = LSBDecoder(stego)
+        self.assertEqual(payload, decoder.extract_bytes())
+        self.assertEqual(0, decoder.fec_report['corrected_blocks'])
+
+        # Одна ошибка в каждом из трех блоков исправляется
+        damaged = stego.copy().reshape(-1)
+        for position in (100, 1100, 2100):
+            damaged[position] ^= 1
+        decoder = LSBDecoder(damaged.reshape(stego.shape))
+        self.assertEqual(payload, decoder.extract_bytes())
+        self.assertEqual(3, decoder.fec_report['corrected_blocks'])
+        self.assertEqual(0, decoder.fec_report['uncorrectable_blocks'])
+
+        # Две ошибки в одном кодовом слове обнаруживаются по CRC
+        damaged[200:202] ^= 1
+        decoder = LSBDecoder(damaged.reshape(stego.shape))
+        with self.assertRaises(Exception):
+            decoder.extract_bytes()
+        self.assertEqual(1, decoder.fec_report['uncorrectable_blocks'])
+
+    def test_probe_without_decoding(self):
+        #"""Тест быстрого получения размеров, вместимости и заголовка нагрузки"""
+        info = LSBEncoder.probe(self.test_image_name, bits_per_channel=2)
+        self.assertEqual((50, 50), (info['width'], info['height']))
+        self.assertEqual('PNG', info['format'])
+        self.assertEqual(LSBEncoder(self.test_image_name, 2).calculate_capacity(), info['capacity'])
+
+        self.assertFalse(LSBDecoder.probe(self.test_image_name)['has_header'])
+
+        LSBEncoder(self.test_image_name, 3, compression='zlib').embed_bytes(b"x" * 200, self.stego_image_name)
+        info = LSBDecoder.probe(self.stego_image_name)
+        self.assertTrue(info['has_header'] and info['valid'])
+        self.assertEqual(3, info['bits_per_channel'])
+        self.assertEqual('zlib', info['codec'])
+        self.assertEqual(LSBDecoder(self.stego_image_name).read_header()['length'], info['length'])
+
+        with open(self.stego_image_name, 'rb') as f:
+            self.assertEqual(info, LSBDecoder.probe(f.read()))
+
+    def test_progress_and_cancellation(self):
+        #"""Тест обработчика хода выполнения и отмены встраивания и извлечения"""
+        calls = []
+        encoder = LSBEncoder(self.test_image_name, progress=lambda done, total: calls.append((done, total)))
+        encoder.WRITE_CHUNK_VALUES = 64
+        payload = b"progress" * 30
+        stego = encoder.embed_to_array(payload)
+        self.assertGreater(len(calls), 1)
+        self.assertEqual(calls[-1][0], calls[-1][1])
+        self.assertEqual([done for done, _ in calls], sorted(done for done, _ in calls))
+
+        calls.clear()
+        decoder = LSBDecoder(stego, progress=lambda done, total: calls.append((done, total)))
+        self.assertEqual(payload, decoder.extract_bytes())
+        self.assertTrue(calls)
+
+        token = CancelToken()
+
+        def cancel_midway(done, total):
+            token.cancel()
+            token.check()
+
+        encoder.progress = cancel_midway
+        with self.assertRaises(CancelledError):
+            encoder.embed_to_array(payload)
+        with self.assertRaises(CancelledError):
+            LSBDecoder(stego, progress=cancel_midway).extract_data()
+
+    def test_http_service_endpoints(self):
+        #"""Тест HTTP-сервиса: встраивание, извлечение, проверка, метрики и статистика"""
+        executor = ThreadPoolExecutor(max_workers=2)
+        service = LSBService(port=0, workers=2, executor=executor)
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(service.start())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        def request(path, body=None, headers=None):
+            url = f"http://127.0.0.1:{service.port}{path}"
+            req = urllib.request.Request(url, data=body, headers=headers or {},
+                                         method='POST' if body is not None else 'GET')
+            with urllib.request.urlopen(req) as response:
+                return response.read(), response.headers
+
+        try:
+            with open(self.test_image_name, 'rb') as f:
+                image = f.read()
+            payload = self.message.encode('utf-8')
+
+            stego, headers = request('/embed?bits_per_channel=2', payload + image,
+                                     {'X-Payload-Length': str(len(payload))})
+            self.assertEqual('image/png', headers['Content-Type'])
+            self.assertEqual(payload, request('/extract', stego)[0])
+
+            info = json.loads(request('/probe', stego)[0])
+            self.assertEqual(len(payload), info['length'])
+            self.assertEqual(2, info['bits_per_channel'])
+
+            report = json.loads(request('/metrics', image + stego,
+                                        {'X-Original-Length': str(len(image))})[0])
+            self.assertGreater(report['PSNR'], 40)
+
+            with self.assertRaises(urllib.error.HTTPError) as error:
+                request('/extract', b'not an image')
+            self.assertEqual(400, error.exception.code)
+
+            # Ключ передается в заголовке, а не в строке запроса
+            stego = request('/embed', payload + image, {'X-Payload-Length': str(len(payload)),
+                                                        'X-Key': 'secret'})[0]
+            self.assertEqual(payload, request('/extract', stego, {'X-Key': 'secret'})[0])
+
+            # Распакованная нагрузка больше предела отклоняется
+            encoder = LSBEncoder(self.test_image_name, compression='zlib')
+            bomb = encoder.embed_to_buffer(bytes(200000))
+            service.max_payload_size = 1000
+            with self.assertRaises(urllib.error.HTTPError) as error:
+                request('/extract', bomb)
+            self.assertEqual(400, error.exception.code)
+
+            # Место в очереди занимается до чтения тела (освобождается после ответа)
+            while service.pending:
+                time.sleep(0.01)
+            service.pending = service.max_pending
+            with self.assertRaises(urllib.error.HTTPError) as error:
+                request('/probe', stego)
+            self.assertEqual(503, error.exception.code)
+            service.pending = 0
+
+            # Внутренние ошибки возвращаются с кодом 500 без подробностей
+            async def failing_handler(query, headers, body):
+                raise RuntimeError("internal details")
+            service.routes[('POST', '/probe')] = failing_handler
+            with self.assertRaises(urllib.error.HTTPError) as error:
+                request('/probe', stego)
+            self.assertEqual(500, error.exception.code)
+            self.assertNotIn('internal details', error.exception.read().decode('utf-8'))
+
+            stats = json.loads(request('/stats')[0])['endpoints']
+            self.assertEqual(2, stats['/embed']['count'])
+            self.assertEqual(4, stats['/extract']['count'])
+            self.assertEqual(2, stats['/extract']['errors'])
+            self.assertEqual(2, stats['/embed']['buckets']['+Inf'])
+        finally:
+            asyncio.run_coroutine_threadsafe(service.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+            executor.shutdown()
+
     def test_overflow_protection(self):
         #"""Тест защиты от переполнения контейнера"""
         huge_message = "A" * 2000 # Сообщение больше вместимости (927 байт)
@@ -81,5 +435,339 @@ class TestLSBSteganography(unittest.TestCase):
         mse = ImageQualityMetrics.calculate_mse(self.test_image_name, self.stego_image_name)
         self.assertEqual(mse, 0.0)
 
+    def test_full_report_from_arrays_matches_files(self):
+        #"""Тест отчета о качестве по массивам в памяти и по файлам"""
+        stego_pixels = self.encoder.embed_to_array(self.message * 10)
+        Image.fromarray(stego_pixels).save(self.stego_image_name)
+
+        from_files = ImageQualityMetrics.get_full_report(self.test_image_name, self.stego_image_name)
+        from_arrays = ImageQualityMetrics.get_full_report(self.encoder.pixels, stego_pixels)
+        self.assertEqual(from_files, from_arrays)
+
+        expected_mse = np.mean((self.encoder.pixels.astype(float) - stego_pixels) ** 2)
+        self.assertAlmostEqual(expected_mse, from_arrays['MSE'], places=4)
+
+    def test_embed_report_matches_metrics(self):
+        #"""Тест отчета о встраивании: MSE/PSNR совпадают с расчетом по изображениям"""
+        report = self.encoder.embed_data(self.message, self.stego_image_name, return_report=True)
+
+        self.assertEqual(report['bits_written'], (HEADER_SIZE + len(self.message)) * 8)
+        mse = ImageQualityMetrics.calculate_mse(self.test_image_name, self.stego_image_name)
+        self.assertAlmostEqual(mse, report['MSE'])
+        self.assertAlmostEqual(ImageQualityMetrics.psnr_from_mse(mse), report['PSNR'])
+        self.assertEqual(report['bits_flipped'], round(mse * self.width * self.height * 3))
+
+        stego = np.array(Image.open(self.stego_image_name))
+        rows, columns = np.nonzero((stego != self.encoder.pixels).any(axis=2))
+        self.assertEqual(report['bbox'], (columns.min(), rows.min(), columns.max() + 1, rows.max() + 1))
+
+    def test_tiled_ssim_matches_full_frame(self):
+        #"""Тест плиточного SSIM: совпадение с полнокадровым в пределах допуска"""
+        original = np.random.default_rng(1).integers(0, 256, (150, 170, 3), dtype=np.uint8)
+        stego = LSBEncoder(original).embed_to_array(bytes(range(256)) * 2)
+
+        for channels in ('gray', 'rgb'):
+            full = ImageQualityMetrics.ssim_from_arrays(original, stego, channels)
+            tiled = ImageQualityMetrics.ssim_from_arrays(original, stego, channels, tiled=True,
+                                                         tile_size=32, workers=2)
+            self.assertLess(full, 1.0)
+            self.assertAlmostEqual(full, tiled, delta=SSIM_TILED_TOLERANCE)
+
+    def test_multi_bit_embedding(self):
+        #"""Тест встраивания 1-4 бит на канал с записью глубины в заголовок"""
+        payload = bytes(range(256)) * 7
+        for bits_per_channel in (2, 3, 4):
+            encoder = LSBEncoder(self.test_image_name, bits_per_channel=bits_per_channel)
+            self.assertEqual(encoder.calculate_capacity(), (7500 - 80) * bits_per_channel // 8)
+            self.assertEqual(encoder.get_image_info()['capacity'], encoder.calculate_capacity())
+
+            report = encoder.embed_bytes(payload, self.stego_image_name, return_report=True)
+            decoder = LSBDecoder(self.stego_image_name)
+            self.assertEqual(bits_per_channel, decoder.read_header()['bits_per_channel'])
+            self.assertEqual(payload, decoder.extract_bytes())
+
+            metrics = ImageQualityMetrics.get_full_report(self.test_image_name, self.stego_image_name)
+            self.assertLessEqual(metrics['MaxDiff'], (1 << bits_per_channel) - 1)
+            self.assertAlmostEqual(metrics['MSE'], report['MSE'], places=4)
+
+            # Для случайного контейнера оценка искажения по глубине и доле значений
+            # близка к измеренной
+            cover = np.random.default_rng(bits_per_channel).integers(0, 256, (50, 50, 3), dtype=np.uint8)
+            _, report = LSBEncoder(cover, bits_per_channel).embed_to_array(payload, return_report=True)
+            summary = ImageQualityMetrics.report_from_embed(report)
+            self.assertLess(abs(summary['ExpectedPSNR'] - summary['PSNR']), 1.0)
+
+        with self.assertRaises(ValueError):
+            LSBEncoder(self.test_image_name, bits_per_channel=5)
+
+    def test_keyed_scatter_embedding(self):
+        #"""Тест рассеивания нагрузки по ключу: извлечение только с тем же ключом"""
+        payload = b"scattered payload" * 4
+        for bits_per_channel in (1, 2):
+            encoder = LSBEncoder(self.test_image_name, bits_per_channel, key="secret")
+            report = encoder.embed_bytes(payload, self.stego_image_name, return_report=True)
+            self.assertEqual(payload, LSBDecoder(self.stego_image_name, key="secret").extract_bytes())
+
+            # Измененные пиксели не сосредоточены в первых строках
+            self.assertGreater(report['bbox'][3], self.height // 2)
+
+            for decoder in (LSBDecoder(self.stego_image_name, key="other"),
+                            LSBDecoder(self.stego_image_name)):
+                # Без ключа или с другим ключом извлечение завершается ошибкой
+                # или возвращает другие данные
+                try:
+                    extracted = decoder.extract_bytes()
+                except Exception:
+                    continue
+                self.assertNotEqual(payload, extracted)
+
+        with self.assertRaises(ValueError):
+            extract_stream(self.stego_image_name)
+
+        # Позиции возрастают, не выходят за изображение и не зависят от деления на порции
+        positions = scatter_positions("secret", 5000, 80, 20000)
+        self.assertTrue(np.all(np.diff(positions) > 0))
+        self.assertTrue(80 <= positions[0] and positions[-1] < 20000)
+        chunks = [scatter_positions("secret", 1000, 80, 20000, start, 5000) for start in range(0, 5000, 1000)]
+        np.testing.assert_array_equal(positions, np.concatenate(chunks))
+        self.assertFalse(np.array_equal(positions, scatter_positions("other", 5000, 80, 20000)))
+
+    def test_compressed_payload_roundtrip(self):
+        #"""Тест сжатия нагрузки: алгоритм в заголовке, прозрачная распаковка"""
+        payload = b'{"level": "info", "event": "request", "status": 200}\n' * 200
+        raw_capacity = self.encoder.calculate_capacity()
+        self.assertGreater(len(payload), raw_capacity)
+
+        for compression in ('auto', 'zlib', 'bz2', 'lzma'):
+            encoder = LSBEncoder(self.test_image_name, compression=compression)
+            self.assertGreater(encoder.calculate_capacity(payload=payload), raw_capacity)
+            self.assertIn('effective_capacity', encoder.get_image_info(payload))
+
+            report = encoder.embed_bytes(payload, self.stego_image_name, return_report=True)
+            decoder = LSBDecoder(self.stego_image_name)
+            header = decoder.read_header()
+            self.assertNotEqual('none', header['codec'])
+            self.assertLess(header['length'], len(payload))
+            self.assertLess(report['bits_written'], len(payload) * 8)
+            self.assertEqual(payload, decoder.extract_bytes())
+            self.assertEqual(payload, extract_stream(self.stego_image_name))
+
+        # Несжимаемые данные записываются без сжатия
+        noise = os.urandom(300)
+        LSBEncoder(self.test_image_name, compression='auto').embed_bytes(noise, self.stego_image_name)
+        decoder = LSBDecoder(self.stego_image_name)
+        self.assertEqual('none', decoder.read_header()['codec'])
+        self.assertEqual(noise, decoder.extract_bytes())
+
+    def test_benchmark_report_and_regressions(self):
+        #"""Тест набора тестов производительности: все этапы в отчете, обнаружение ухудшений"""
+        report = run_benchmark(sizes=[0.01], payloads=['16', 'full'], memory=True, import_modules=())
+        results = report['results']
+        self.assertEqual(list(STAGES) * 2, [result['stage'] for result in results])
+        for result in results:
+            self.assertGreater(result['seconds'], 0)
+            self.assertGreater(result['peak_tracemalloc_bytes'], 0)
+        self.assertEqual(16, results[0]['payload_bytes'])
+        json.dumps(report)
+
+        # Сравнение с собой не дает ухудшений, замедление в 10 раз обнаруживается
+        self.assertEqual([], compare_results(report, report, threshold=0.2))
+        slower = {'results': [dict(result, seconds=result['seconds'] * 10 + 0.01) for result in results]}
+        regressions = compare_results(slower, report, threshold=0.2)
+        self.assertEqual(len(results), len(regressions))
+
+    def test_steganalysis_scan(self):
+        #"""Тест стегоанализа: чистое изображение, последовательная и рассеянная нагрузка"""
+        # Синтетический шум выравнивает пары значений, поэтому нужна фотография
+        from skimage import data
+        cover = np.ascontiguousarray(data.astronaut())
+        capacity = LSBEncoder(cover).calculate_capacity()
+        window = cover.size // 32
+
+        clean = analyze(cover, window)
+        self.assertFalse(clean['suspicious'])
+        self.assertIsNone(clean['region'])
+
+        # Последовательная запись в первую половину: область найдена с точностью до окон
+        sequential = LSBEncoder(cover).embed_to_array(os.urandom(capacity // 2))
+        result = analyze(sequential, window)
+        self.assertTrue(result['suspicious'])
+        self.assertEqual(0, result['region'][0])
+        self.assertLess(abs(result['region'][1] - cover.size // 2), 3 * window)
+
+        # Рассеянная запись по ключу обнаруживается RS-анализом
+        scattered = LSBEncoder(cover, key='secret').embed_to_array(os.urandom(capacity // 2))
+        result = analyze(scattered)
+        self.assertTrue(result['suspicious'])
+        self.assertGreater(result['rs_estimate'], 0.3)
+        self.assertLess(clean['rs_estimate'], 0.05)
+
+        with tempfile.TemporaryDirectory() as directory:
+            Image.fromarray(cover).save(os.path.join(directory, 'clean.png'))
+            Image.fromarray(scattered).save(os.path.join(directory, 'stego.png'))
+            results = {os.path.basename(result['file']): result
+                       for result in run_batch('scan', iter_images(directory), {'window': window}, workers=2)}
+        self.assertEqual({'clean.png', 'stego.png'}, set(results))
+        self.assertFalse(results['clean.png']['suspicious'])
+        self.assertTrue(results['stego.png']['suspicious'])
+
+    def test_core_import_is_lightweight(self):
+        #"""Тест импорта ядра без scikit-image и SciPy: они загружаются при первом расчете SSIM"""
+        import subprocess
+        import sys
+        modules = 'lsb_encoder, lsb_decoder, lsb_batch, lsb_service, metrics, steganalysis'
+        code = f"import sys, {modules}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        self.assertEqual('', output.strip())
+
+        # При расчете SSIM нужный модуль подгружается автоматически
+        report = ImageQualityMetrics.get_full_report(self.test_image_name, self.test_image_name)
+        self.assertEqual(1.0, report['SSIM'])
+
+    def test_instrumentation_stages(self):
+        #"""Тест замеров этапов: пустой сборщик по умолчанию, время, счетчики и профиль"""
+        self.assertIs(current().stage('load'), current().stage('embed'))
+        self.assertEqual({}, current().summary()['stages'])
+
+        # Без кэша пикселей метрики декодируют исходное изображение заново
+        get_cache().clear()
+        finished = []
+        with collect(profile=True, trace_memory=True,
+                     callback=lambda name, seconds, counters: finished.append(name)) as stats:
+            self.encoder.embed_data("Hello", self.stego_image_name)
+            LSBDecoder(self.stego_image_name).extract_data()
+            ImageQualityMetrics.get_full_report(self.test_image_name, self.stego_image_name)
+        self.assertIs(current().stage('load'), current().stage('embed'))
+
+        stages = stats.summary()['stages']
+        for name in ('pack', 'embed', 'encode', 'load', 'decode', 'convert', 'extract',
+                     'metrics.load', 'metrics.mse', 'metrics.ssim'):
+            self.assertIn(name, stages)
+            self.assertIn(name, finished)
+            self.assertGreater(stages[name]['calls'], 0)
+            self.assertIn('peak_memory', stages[name])
+        self.assertEqual(len(b"Hello"), stages['extract']['bytes'])
+        self.assertEqual(50 * 50, stages['load']['pixels'])
+        self.assertIn('embed', stats.format_summary())
+        self.assertIn('write_sequential', stats.profile_stats(limit=500))
+
+        # Пакетная обработка с --stats добавляет время этапов к каждому результату
+        with tempfile.TemporaryDirectory() as directory:
+            self.encoder.embed_data("Hello", os.path.join(directory, 'stego.png'))
+            result, = run_batch('extract', iter_images(directory), {'stats': True}, workers=1)
+        self.assertEqual('ok', result['status'])
+        self.assertIn('extract', result['stages'])
+
+    def test_decoded_image_cache(self):
+        #"""Тест кэша пикселей: повторная загрузка без декодирования, стего-изображение в кэше"""
+        get_cache().clear()
+        with collect() as stats:
+            first = LSBEncoder(self.test_image_name)
+            second = LSBEncoder(self.test_image_name)
+        self.assertIs(first.pixels, second.pixels)
+        self.assertFalse(second.pixels.flags.writeable)
+        self.assertEqual(1, stats.summary()['stages']['decode']['calls'])
+
+        # Записанное стего-изображение читается и сравнивается без декодирования
+        first.embed_data("Hello", self.stego_image_name)
+        with collect() as stats:
+            self.assertEqual("Hello", LSBDecoder(self.stego_image_name).extract_data())
+            ImageQualityMetrics.get_full_report(self.test_image_name, self.stego_image_name)
+        self.assertNotIn('decode', stats.summary()['stages'])
+
+        # Когда файл перестает быть недавно измененным, запись находится по ключу файла
+        written = os.stat(self.stego_image_name).st_mtime - 10
+        os.utime(self.stego_image_name, (written, written))
+        self.assertEqual('file', get_cache().key_for(self.stego_image_name)[0])
+        with collect() as stats:
+            self.assertEqual("Hello", LSBDecoder(self.stego_image_name).extract_data())
+            self.assertEqual("Hello", LSBDecoder(self.stego_image_name).extract_data())
+        self.assertNotIn('decode', stats.summary()['stages'])
+
+        # Файл, перезаписанный сразу после чтения, опознается по содержимому
+        second.embed_data("World", self.stego_image_name)
+        pixels = np.array(Image.open(self.stego_image_name))
+        pixels[0, 0, 0] ^= 1
+        Image.fromarray(pixels).save(self.stego_image_name)
+        self.assertTrue(np.array_equal(pixels, LSBDecoder(self.stego_image_name).pixels))
+
+        # Недавно измененный файл опознается только по содержимому, без ключа по времени изменения
+        self.assertEqual('content', get_cache().key_for(self.stego_image_name)[0])
+
+        # Байты кэшируются по хэшу содержимого
+        with open(self.test_image_name, 'rb') as f:
+            data = f.read()
+        self.assertIs(LSBDecoder(data).pixels, LSBDecoder(bytearray(data)).pixels)
+
+        # Вытеснение давно не использованных массивов при превышении бюджета
+        cache = ImageCache(max_bytes=2 * 300)
+        arrays = [np.zeros((10, 10, 3), dtype=np.uint8) for _ in range(3)]
+        for index, array in enumerate(arrays):
+            cache.put(('test', index), array)
+            cache.get(('test', 0))
+        self.assertIsNotNone(cache.get(('test', 0)))
+        self.assertIsNone(cache.get(('test', 1)))
+        self.assertIsNotNone(cache.get(('test', 2)))
+        self.assertEqual(600, cache.stats()['bytes'])
+        cache.resize(0)
+        self.assertEqual(0, cache.stats()['entries'])
+
+    def test_multiframe_embedding(self):
+        #"""Тест встраивания в страницы TIFF разного размера и кадры GIF с записью в APNG"""
+        from PIL import TiffImagePlugin
+
+        rng = np.random.default_rng(5)
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'pages.tif')
+            with TiffImagePlugin.AppendingTiffWriter(source, new=True) as tiff:
+                for height, width in ((20, 30), (40, 10), (15, 15)):
+                    pixels = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+                    Image.fromarray(pixels).save(tiff, format='TIFF')
+                    tiff.newFrame()
+
+            info = LSBEncoder.probe(source, bits_per_channel=3)
+            self.assertEqual(3, info['frames'])
+            self.assertGreater(info['frames_capacity'], info['capacity'])
+
+            # Нагрузка на все кадры: символы по 3 бита переходят через границы кадров
+            payload = rng.integers(0, 256, info['frames_capacity'], dtype=np.uint8).tobytes()
+            output = os.path.join(directory, 'stego.tif')
+            report = embed_frames(source, payload, output, bits_per_channel=3)
+            self.assertEqual(3, report['used_frames'])
+            self.assertEqual(payload, LSBDecoder(output).extract_bytes())
+            probe = LSBDecoder.probe(output)
+            self.assertTrue(probe['multiframe'])
+            self.assertTrue(probe['valid'])
+            with self.assertRaises(Exception):
+                embed_frames(source, payload + b'!', output, bits_per_channel=3)
+
+            # Кадры GIF записываются в APNG; короткая нагрузка занимает только первый кадр
+            frames = [Image.fromarray(rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)).convert('P')
+                      for _ in range(4)]
+            animation = os.path.join(directory, 'animation.gif')
+            frames[0].save(animation, save_all=True, append_images=frames[1:], duration=70)
+            with self.assertRaises(Exception):
+                embed_frames(animation, self.message, os.path.join(directory, 'stego.gif'))
+
+            output = os.path.join(directory, 'stego.png')
+            report = embed_frames(animation, self.message, output, compression='zlib',
+                                  error_correction=True)
+            self.assertEqual(1, report['used_frames'])
+            with Image.open(output) as image:
+                self.assertEqual(4, image.n_frames)
+            self.assertEqual(self.message, LSBDecoder(output).extract_data())
+            with self.assertRaises(ValueError):
+                extract_stream(output)
+
+            # Нагрузка, целиком лежащая в первом кадре, читается и из массива этого кадра
+            with Image.open(output) as image:
+                first_frame = np.array(image.convert('RGB'))
+            self.assertEqual(self.message, LSBDecoder(first_frame).extract_data())
+            with Image.open(os.path.join(directory, 'stego.tif')) as image:
+                first_page = np.array(image.convert('RGB'))
+            with self.assertRaisesRegex(Exception, 'NumPy'):
+                LSBDecoder(first_page).extract_bytes()
+
 if __name__ == '__main__':
     unittest.main()